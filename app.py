@@ -1,15 +1,21 @@
+from startup import init_pygame, startup  # first, so loading pygame is timed too
 import pygame
 import random
 import math
 import sys
-
-# Initialize pygame
-pygame.init()
+import time
+import argparse
+from itertools import islice
+import numpy as np
+from atlas import Atlas
+from fonts import HudNumber, sys_font, text_cache
+from profiler import NULL_PROFILER, profiler_from_env
+from replay import NULL_RECORDER, Recorder, replay, state_digest, summary
+from timestep import BASE_RATE, MAX_CATCH_UP, FixedTimestep, cooldown_over
+from governor import governor_from_budget
 
 # Screen dimensions
 WIDTH, HEIGHT = 800, 600
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("جنگنده مدرن - Modern Fighter")
 
 # Colors
 BLACK = (0, 0, 0)
@@ -56,237 +62,844 @@ def create_explosion(radius):
     pygame.draw.circle(surf, YELLOW, (radius, radius), radius//2)
     return surf
 
+# Explosion radii baked into the atlas; others use the nearest of these
+EXPLOSION_RADII = range(4, 33, 4)
+
+def sprite_factories():
+    factories = {"fighter": create_fighter, "enemy": create_enemy, "bullet": create_bullet}
+    for radius in EXPLOSION_RADII:
+        factories[f"explosion_{radius}"] = lambda radius=radius: create_explosion(radius)
+    return factories
+
+# Every sprite is drawn once into an atlas kept on disk; entities hold their
+# rect on the sheet and blit the shared sheet with it
+sprites = Atlas("app-sprites", sprite_factories(), [__file__])
+
+def explosion_area(radius):
+    radius = min(EXPLOSION_RADII, key=lambda baked: abs(baked - radius))
+    return sprites.area(f"explosion_{radius}")
+
+# Initial pool sizes; pools grow past these if a wave needs more
+ENEMY_POOL_SIZE = 32
+BULLET_POOL_SIZE = 64
+PARTICLE_POOL_SIZE = 512
+PARTICLE_BURST = 20  # particles per explosion
+PARTICLE_MAX_LIFE = 40
+PARTICLE_COLORS = [RED, ORANGE, YELLOW]
+PARTICLE_CHANNELS = np.array(PARTICLE_COLORS, dtype=np.float32)
+
+STAR_COUNT = 100
+STAR_LAYERS = 3
+
+# Effect settings per quality level, lowest first: particles per explosion
+# and how many star layers are drawn (the slowest, farthest ones go first)
+QUALITY_LEVELS = [
+    (5, 1),
+    (10, 2),
+    (15, STAR_LAYERS),
+    (PARTICLE_BURST, STAR_LAYERS),
+]
+
+# Input bits for one simulation step
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_UP = 4
+INPUT_DOWN = 8
+INPUT_FIRE = 16
+INPUT_RESTART = 32
+
+# Collision events, as (kind, bullet index or None, enemy index)
+CONTACT = "contact"  # an enemy touched the fighter
+HIT = "hit"          # a bullet hit an enemy
+KILL = "kill"        # a bullet hit an enemy and destroyed it
+BULLET_DAMAGE = 5
+CONTACT_DAMAGE = 10
+
 # Game classes
 class Fighter:
     def __init__(self):
-        self.image = create_fighter()
-        self.rect = self.image.get_rect(center=(WIDTH//2, HEIGHT-100))
+        self.area = sprites.area("fighter")
+        self.rect = pygame.Rect((0, 0), self.area.size)
+        self.rect.center = (WIDTH//2, HEIGHT-100)
+        # Float position; the rect is it rounded, so fractional moves at
+        # tick rates other than 60 Hz add up instead of being lost
+        self.x, self.y = self.rect.topleft
+        self.last = (self.x, self.y)
         self.speed = 8
         self.health = 100
         self.last_shot = 0
         self.shoot_delay = 200  # milliseconds
 
-    def update(self, keys):
-        if keys[pygame.K_LEFT] and self.rect.left > 0:
-            self.rect.x -= self.speed
-        if keys[pygame.K_RIGHT] and self.rect.right < WIDTH:
-            self.rect.x += self.speed
-        if keys[pygame.K_UP] and self.rect.top > 0:
-            self.rect.y -= self.speed
-        if keys[pygame.K_DOWN] and self.rect.bottom < HEIGHT:
-            self.rect.y += self.speed
-
-    def shoot(self, current_time):
-        if current_time - self.last_shot > self.shoot_delay:
+    def update(self, inputs, scale=1.0):
+        self.last = (self.x, self.y)
+        speed = self.speed * scale
+        if inputs & INPUT_LEFT and self.rect.left > 0:
+            self.x -= speed
+        if inputs & INPUT_RIGHT and self.rect.right < WIDTH:
+            self.x += speed
+        if inputs & INPUT_UP and self.rect.top > 0:
+            self.y -= speed
+        if inputs & INPUT_DOWN and self.rect.bottom < HEIGHT:
+            self.y += speed
+        self.rect.topleft = (round(self.x), round(self.y))
+
+    def shoot(self, current_time, bullets):
+        if cooldown_over(current_time, self.last_shot, self.shoot_delay):
             self.last_shot = current_time
-            return Bullet(self.rect.centerx, self.rect.top)
-        return None
+            bullets.acquire().reset(self.rect.centerx, self.rect.top)
+            return True
+        return False
 
     def draw(self, surface):
-        surface.blit(self.image, self.rect)
+        return surface.blit(sprites.surface(), self.rect, self.area)
+
+class Pool:
+    # Preallocated entities: items[:count] are live and items[count:] are
+    # free for reuse. Removal swaps the last live item into the freed slot,
+    # so iterate backwards when releasing during a pass.
+    def __init__(self, factory, capacity):
+        self.factory = factory
+        self.items = [factory() for _ in range(capacity)]
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return islice(self.items, self.count)
 
+    def acquire(self):
+        if self.count == len(self.items):
+            self.items.append(self.factory())
+        item = self.items[self.count]
+        self.count += 1
+        return item
+
+    def release(self, index):
+        last = self.count - 1
+        items = self.items
+        items[index], items[last] = items[last], items[index]
+        self.count = last
+
+    def release_all(self, indices):
+        # Highest index first, so no item still to be released is swapped
+        # into an earlier slot
+        for index in sorted(set(indices), reverse=True):
+            self.release(index)
+
+    def clear(self):
+        self.count = 0
+
+# Pooled entities are built empty and set up by reset() on each spawn
 class Enemy:
+    __slots__ = ("area", "rect", "x", "y", "last", "speed", "health")
+
     def __init__(self):
-        self.image = create_enemy()
-        self.rect = self.image.get_rect(center=(random.randint(30, WIDTH-30), -30))
-        self.speed = random.randint(2, 5)
+        self.area = None
+        self.rect = pygame.Rect(0, 0, 0, 0)
+        self.x = self.y = 0
+        self.last = (0, 0)
+        self.speed = 0
+        self.health = 0
+
+    def reset(self, rng=random):
+        self.area = sprites.area("enemy")
+        self.rect.size = self.area.size
+        self.rect.center = (rng.randint(30, WIDTH-30), -30)
+        self.x, self.y = self.rect.topleft
+        self.last = (self.x, self.y)
+        self.speed = rng.randint(2, 5)
         self.health = 10
 
-    def update(self):
-        self.rect.y += self.speed
+    def update(self, scale=1.0):
+        self.last = (self.x, self.y)
+        self.y += self.speed * scale
+        self.rect.y = round(self.y)
         return self.rect.top > HEIGHT
 
     def draw(self, surface):
-        surface.blit(self.image, self.rect)
+        return surface.blit(sprites.surface(), self.rect, self.area)
 
 class Bullet:
-    def __init__(self, x, y):
-        self.image = create_bullet()
-        self.rect = self.image.get_rect(center=(x, y))
+    __slots__ = ("area", "rect", "x", "y", "last", "speed")
+
+    def __init__(self):
+        self.area = None
+        self.rect = pygame.Rect(0, 0, 0, 0)
+        self.x = self.y = 0
+        self.last = (0, 0)
         self.speed = 10
 
-    def update(self):
-        self.rect.y -= self.speed
+    def reset(self, x, y):
+        self.area = sprites.area("bullet")
+        self.rect.size = self.area.size
+        self.rect.center = (x, y)
+        self.x, self.y = self.rect.topleft
+        self.last = (self.x, self.y)
+
+    def update(self, scale=1.0):
+        self.last = (self.x, self.y)
+        self.y -= self.speed * scale
+        self.rect.y = round(self.y)
         return self.rect.bottom < 0
 
     def draw(self, surface):
-        surface.blit(self.image, self.rect)
-
-class Particle:
-    def __init__(self, x, y):
-        self.rect = pygame.Rect(x, y, random.randint(2, 6), random.randint(2, 6))
-        self.color = random.choice([RED, ORANGE, YELLOW])
-        self.speed_x = random.uniform(-2, 2)
-        self.speed_y = random.uniform(-2, 2)
-        self.lifetime = random.randint(20, 40)
-
-    def update(self):
-        self.rect.x += self.speed_x
-        self.rect.y += self.speed_y
-        self.lifetime -= 1
-        return self.lifetime <= 0
+        return surface.blit(sprites.surface(), self.rect, self.area)
+
+class ParticleSystem:
+    # Every particle as a row of NumPy arrays, live ones in [0, count), with
+    # float positions so slow drifts are not lost to Rect's integers.
+    # draw() writes them all straight into the frame's pixels: particles
+    # are grouped by size and each group is one scatter into a flat view of
+    # the surface. With `fade` the colour is blended over the background by
+    # remaining lifetime; with `additive` it is added to it (overlapping
+    # particles of one frame do not add up, the last one drawn wins).
+    def __init__(self, capacity=PARTICLE_POOL_SIZE):
+        self.count = 0
+        self.pos = np.zeros((capacity, 2))
+        self.vel = np.zeros((capacity, 2))
+        self.size = np.zeros((capacity, 2), dtype=np.int32)
+        self.color = np.zeros(capacity, dtype=np.uint8)  # index into PARTICLE_COLORS
+        self.life = np.zeros(capacity)
+        self.fade = False
+        self.additive = False
+        self.offsets = {}
+
+    def __len__(self):
+        return self.count
+
+    def arrays(self):
+        return self.pos, self.vel, self.size, self.color, self.life
+
+    def emit(self, x, y, rng=random, count=PARTICLE_BURST):
+        # Draws from rng in the same order as one reset() per particle did,
+        # so the world's random stream is unchanged
+        rows = []
+        for _ in range(count):
+            w = rng.randint(2, 6)
+            h = rng.randint(2, 6)
+            color = rng.randrange(len(PARTICLE_COLORS))
+            rows.append((w, h, color, rng.uniform(-2, 2), rng.uniform(-2, 2), rng.randint(20, 40)))
+        if not rows:
+            return
+        while self.count + count > len(self.life):
+            for name in ("pos", "vel", "size", "color", "life"):
+                array = getattr(self, name)
+                setattr(self, name, np.concatenate([array, np.zeros_like(array)]))
+
+        w, h, color, speed_x, speed_y, life = zip(*rows)
+        s = slice(self.count, self.count + count)
+        self.pos[s] = (x, y)
+        self.vel[s, 0] = speed_x
+        self.vel[s, 1] = speed_y
+        self.size[s, 0] = w
+        self.size[s, 1] = h
+        self.color[s] = color
+        self.life[s] = life
+        self.count += count
+
+    def update(self, scale=1.0):
+        n = self.count
+        if n == 0:
+            return
+        self.pos[:n] += self.vel[:n] * scale
+        self.life[:n] -= scale
+
+        # Live particles from the end fill the slots of dead ones
+        dead = np.flatnonzero(self.life[:n] <= 0)
+        if len(dead) == 0:
+            return
+        alive = n - len(dead)
+        holes = dead[dead < alive]
+        movers = np.flatnonzero(self.life[alive:n] > 0) + alive
+        for array in self.arrays():
+            array[holes] = array[movers]
+        self.count = alive
+
+    def clear(self):
+        self.count = 0
+
+    def state(self):
+        # Bytes of every live particle, for the world checksum
+        return b"".join(array[:self.count].tobytes() for array in self.arrays())
+
+    def size_offsets(self, stride):
+        # Flat pixel offsets of every w x h block, for a surface whose rows
+        # are `stride` pixels apart
+        offsets = self.offsets.get(stride)
+        if offsets is None:
+            offsets = {}
+            for w in range(2, 7):
+                for h in range(2, 7):
+                    rows, columns = np.mgrid[0:h, 0:w]
+                    offsets[w, h] = (rows * stride + columns).ravel()
+            self.offsets = {stride: offsets}
+        return offsets
 
     def draw(self, surface):
-        pygame.draw.rect(surface, self.color, self.rect)
+        # Returns the bounding rect of everything drawn, for dirty rects
+        n = self.count
+        if n == 0:
+            return []
+        x = self.pos[:n, 0].astype(np.int32)
+        y = self.pos[:n, 1].astype(np.int32)
+        w = self.size[:n, 0]
+        h = self.size[:n, 1]
+        width, height = surface.get_size()
+        visible = (x < width) & (y < height) & (x + w > 0) & (y + h > 0)
+        inside = visible & (x >= 0) & (y >= 0) & (x + w <= width) & (y + h <= height)
+        edge = np.flatnonzero(visible & ~inside)
+        bounds = pygame.Rect(x.min(), y.min(), (x + w).max() - x.min(), (y + h).max() - y.min())
+
+        if surface.get_bytesize() != 4:
+            # No flat 32-bit view; fill particle by particle
+            for i in np.flatnonzero(visible):
+                surface.fill(PARTICLE_COLORS[self.color[i]], (x[i], y[i], w[i], h[i]))
+            return [bounds.clip(surface.get_rect())]
+
+        # The buffer locks the surface until it is released
+        pixels = np.frombuffer(surface.get_buffer(), dtype=np.uint32)
+        stride = surface.get_pitch() // 4
+        # map_rgb returns a signed int, negative when the top (alpha) bit is set
+        mapped = np.array([surface.map_rgb(color) & 0xFFFFFFFF for color in PARTICLE_COLORS],
+                          dtype=np.uint32)
+
+        # Particles fully on screen, grouped by size: one scatter per group.
+        # Draw order is kept only within a group: where particles of
+        # different sizes overlap, the later size group wins.
+        inside = np.flatnonzero(inside)
+        key = (w[inside] * 8 + h[inside]).astype(np.uint8)
+        order = np.argsort(key, kind="stable")
+        index = inside[order]
+        base = y[index] * stride + x[index]
+        groups = np.bincount(key, minlength=64)
+        offsets = self.size_offsets(stride)
+        start = 0
+        for group in np.flatnonzero(groups):
+            end = start + groups[group]
+            self.blend(surface, pixels, mapped, base[start:end, None] + offsets[group >> 3, group & 7],
+                       index[start:end, None])
+            start = end
+
+        # Particles cut by an edge, pixel by pixel with clipping
+        if len(edge):
+            rows, columns = np.divmod(np.arange(36), 6)
+            px = x[edge, None] + columns
+            py = y[edge, None] + rows
+            keep = ((columns < w[edge, None]) & (rows < h[edge, None])
+                    & (px >= 0) & (px < width) & (py >= 0) & (py < height))
+            self.blend(surface, pixels, mapped, (py * stride + px)[keep],
+                       np.broadcast_to(edge[:, None], keep.shape)[keep])
+        del pixels
+        return [bounds.clip(surface.get_rect())]
+
+    def blend(self, surface, pixels, mapped, indices, ids):
+        # Write particles `ids` into pixels[indices]; ids broadcasts against
+        # indices (one id per pixel, or one per row of pixels)
+        color = self.color[ids]
+        if not self.fade and not self.additive:
+            pixels[indices] = np.broadcast_to(mapped[color], indices.shape)
+            return
+
+        # One gather of the pixels under the particles, blended per byte
+        background = pixels[indices]
+        channels = [shift // 8 if sys.byteorder == "little" else 3 - shift // 8
+                    for shift in surface.get_shifts()[:3]]
+        under = background.view(np.uint8).reshape(*background.shape, 4)
+        rgb = under[..., channels].astype(np.float32)
+        over = PARTICLE_CHANNELS[color]
+        if self.fade:
+            over = over * (self.life[ids, None] / PARTICLE_MAX_LIFE).astype(np.float32)
+        if self.additive:
+            rgb += over
+            np.minimum(rgb, 255, out=rgb)
+        else:
+            rgb *= 1 - (self.life[ids, None] / PARTICLE_MAX_LIFE).astype(np.float32)
+            rgb += over
+        under[..., channels] = rgb
+        pixels[indices] = background
+
+class StarLayer:
+    __slots__ = ("surface", "speed", "stars", "offset")
+
+    def __init__(self, stars):
+        # Stars are (x, y, radius); ones near the bottom edge are drawn again
+        # above the top so the seam is invisible when the layer wraps
+        self.surface = pygame.Surface((WIDTH, HEIGHT))
+        for x, y, size, speed in stars:
+            for copy_y in (y, y - HEIGHT, y + HEIGHT):
+                pygame.draw.circle(self.surface, WHITE, (x, copy_y), size)
+        if pygame.display.get_surface() is not None:
+            self.surface = self.surface.convert()
+        self.surface.set_colorkey(BLACK, pygame.RLEACCEL)
+        self.speed = sum(star[3] for star in stars) / len(stars) if stars else 0
+        self.stars = [(x, y, size) for x, y, size, speed in stars]
+        self.offset = 0.0
+
+class StarField:
+    # The stars pre-rendered onto a few screen-sized layers, one per speed
+    # band, each scrolled down with wrap-around. Drawing is two blits per
+    # layer however many stars there are.
+    def __init__(self, count=STAR_COUNT, layers=STAR_LAYERS, track_rects=False, rng=random):
+        bands = [[] for _ in range(layers)]
+        for _ in range(count):
+            x = rng.randint(0, WIDTH)
+            y = rng.randint(0, HEIGHT)
+            size = rng.randint(1, 3)
+            speed = rng.uniform(0.2, 1.0)
+            bands[min(int((speed - 0.2) / 0.8 * layers), layers - 1)].append((x, y, size, speed))
+        self.layers = [StarLayer(stars) for stars in bands]
+        self.shown_layers = layers
+        self.count = count
+        # Per-star rects are only worth building for the dirty-rect renderer
+        self.track_rects = track_rects
+
+    def __len__(self):
+        return self.count
+
+    def update(self, scale=1.0):
+        for layer in self.layers:
+            layer.offset = (layer.offset + layer.speed * scale) % HEIGHT
 
-class Star:
-    def __init__(self):
-        self.x = random.randint(0, WIDTH)
-        self.y = random.randint(0, HEIGHT)
-        self.size = random.randint(1, 3)
-        self.speed = random.uniform(0.2, 1.0)
-        
-    def update(self):
-        self.y += self.speed
-        if self.y > HEIGHT:
-            self.y = 0
-            self.x = random.randint(0, WIDTH)
-            
     def draw(self, surface):
-        pygame.draw.circle(surface, WHITE, (int(self.x), int(self.y)), self.size)
-
-# Game setup
-fighter = Fighter()
-enemies = []
-bullets = []
-particles = []
-stars = [Star() for _ in range(100)]
-score = 0
-enemy_spawn_timer = 0
-game_over = False
-font = pygame.font.SysFont(None, 36)
-
-# Main game loop
-clock = pygame.time.Clock()
-running = True
-
-while running:
-    current_time = pygame.time.get_ticks()
-    
-    # Event handling
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        if event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_SPACE and not game_over:
-                bullet = fighter.shoot(current_time)
-                if bullet:
-                    bullets.append(bullet)
-            if event.key == pygame.K_r and game_over:
-                # Reset game
-                fighter = Fighter()
-                enemies = []
-                bullets = []
-                particles = []
-                score = 0
-                game_over = False
-    
-    if not game_over:
-        # Get keyboard state
-        keys = pygame.key.get_pressed()
-        
-        # Update fighter
-        fighter.update(keys)
-        
-        # Auto-shooting
-        if keys[pygame.K_SPACE]:
-            bullet = fighter.shoot(current_time)
-            if bullet:
-                bullets.append(bullet)
-        
-        # Spawn enemies
-        enemy_spawn_timer += 1
-        if enemy_spawn_timer >= 60:  # Spawn every 60 frames
-            enemies.append(Enemy())
-            enemy_spawn_timer = 0
-        
-        # Update enemies
-        for enemy in enemies[:]:
-            if enemy.update():
-                enemies.remove(enemy)
-            # Check collision with fighter
-            if enemy.rect.colliderect(fighter.rect):
-                fighter.health -= 10
-                enemies.remove(enemy)
-                # Create explosion particles
-                for _ in range(20):
-                    particles.append(Particle(enemy.rect.centerx, enemy.rect.centery))
+        rects = []
+        for layer in self.layers[len(self.layers) - self.shown_layers:]:
+            offset = int(layer.offset)
+            surface.blit(layer.surface, (0, offset))
+            surface.blit(layer.surface, (0, offset - HEIGHT))
+            if self.track_rects:
+                for x, y, size in layer.stars:
+                    y = (y + offset) % HEIGHT
+                    rects.append(pygame.Rect(x - size, y - size, 2 * size + 1, 2 * size + 1))
+                    # A star cut by an edge shows again at the other one
+                    if y + size >= HEIGHT:
+                        rects.append(pygame.Rect(x - size, y - size - HEIGHT, 2 * size + 1, 2 * size + 1))
+                    elif y - size < 0:
+                        rects.append(pygame.Rect(x - size, y - size + HEIGHT, 2 * size + 1, 2 * size + 1))
+        return rects
+
+def swept_rect(entity):
+    # The area an entity covered moving from its last position to now
+    x, y = entity.last
+    return entity.rect.union(pygame.Rect((round(x), round(y)), entity.rect.size))
+
+def find_collisions(fighter, enemies, bullets):
+    # The collision events of one step, in the order they are to be
+    # applied: every enemy touching the fighter by pool index, then the
+    # bullets from the top of the screen down, each hitting the first live
+    # enemy in its path (the lowest one). Bullets and enemies are tested
+    # swept over their last step, so a fast bullet cannot pass through a
+    # target between two steps; both move only vertically, so overlapping
+    # sweeps mean they really met. Nothing is changed here.
+    enemy_rects = [enemy.rect for enemy in enemies]
+    contacts = fighter.rect.collidelistall(enemy_rects)
+    events = [(CONTACT, None, index) for index in contacts]
+    if not bullets or not enemy_rects:
+        return events
+
+    health = [enemy.health for enemy in enemies]
+    for index in contacts:
+        health[index] = 0
+    swept = [swept_rect(enemy) for enemy in enemies]
+    order = sorted(range(len(bullets)), key=lambda index: (bullets.items[index].rect.top, index))
+    for bullet_index in order:
+        targets = [index for index in swept_rect(bullets.items[bullet_index]).collidelistall(swept)
+                   if health[index] > 0]
+        if not targets:
+            continue
+        enemy_index = max(targets, key=lambda index: (enemy_rects[index].bottom, -index))
+        health[enemy_index] -= BULLET_DAMAGE
+        events.append((KILL if health[enemy_index] <= 0 else HIT, bullet_index, enemy_index))
+    return events
+
+class World:
+    # Game state and rules only: no events, clock or drawing, so it runs
+    # without a window. The same seed and inputs give the same game.
+    def __init__(self, seed=None):
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.enemy_spawn_timer = 0
+        self.time = 0  # simulated milliseconds
+        self.frame = 0
+        self.profiler = NULL_PROFILER
+        self.enemies = Pool(Enemy, ENEMY_POOL_SIZE)
+        self.bullets = Pool(Bullet, BULLET_POOL_SIZE)
+        self.particles = ParticleSystem()
+        self.particle_burst = PARTICLE_BURST
+        self.reset()
+
+    def reset(self):
+        self.fighter = Fighter()
+        self.enemies.clear()
+        self.bullets.clear()
+        self.particles.clear()
+        self.score = 0
+        self.game_over = False
+
+    def checksum(self):
+        # Digest of everything the rules depend on, for replay verification
+        fighter = self.fighter
+        return state_digest(
+            self.frame, self.time, self.score, self.game_over, self.enemy_spawn_timer,
+            (fighter.x, fighter.y), fighter.health, fighter.last_shot,
+            [(e.x, e.y, e.speed, e.health) for e in self.enemies],
+            [(b.x, b.y) for b in self.bullets],
+            self.particles.state(),
+            self.random.getstate())
+
+    def explode(self, rect):
+        self.particles.emit(rect.centerx, rect.centery, self.random, self.particle_burst)
+
+    def apply_collisions(self, events):
+        # Indices in the events refer to the pools as they were when the
+        # events were found, so removal waits until all are applied
+        fighter = self.fighter
+        enemies = self.enemies.items
+        removed = []
+        spent = []
+        for kind, bullet_index, enemy_index in events:
+            enemy = enemies[enemy_index]
+            if kind == CONTACT:
+                fighter.health -= CONTACT_DAMAGE
+                self.explode(enemy.rect)
+                removed.append(enemy_index)
                 if fighter.health <= 0:
-                    game_over = True
-        
-        # Update bullets
-        for bullet in bullets[:]:
-            if bullet.update():
-                bullets.remove(bullet)
-            else:
-                # Check collision with enemies
-                for enemy in enemies[:]:
-                    if bullet.rect.colliderect(enemy.rect):
-                        enemy.health -= 5
-                        if enemy.health <= 0:
-                            enemies.remove(enemy)
-                            score += 10
-                            # Create explosion particles
-                            for _ in range(20):
-                                particles.append(Particle(enemy.rect.centerx, enemy.rect.centery))
-                        if bullet in bullets:
-                            bullets.remove(bullet)
-                        break
-        
+                    self.game_over = True
+                continue
+
+            enemy.health -= BULLET_DAMAGE
+            spent.append(bullet_index)
+            if kind == KILL:
+                self.score += 10
+                self.explode(enemy.rect)
+                removed.append(enemy_index)
+        self.enemies.release_all(removed)
+        self.bullets.release_all(spent)
+
+    def step(self, inputs, dt):
+        self.frame += 1
+        self.time += dt * 1000
+
+        if inputs & INPUT_RESTART and self.game_over:
+            self.reset()
+        if self.game_over:
+            return
+
+        fighter = self.fighter
+        enemies = self.enemies
+        bullets = self.bullets
+        particles = self.particles
+        profiler = self.profiler
+        # Speeds and timers are tuned per 60 Hz frame
+        scale = dt * BASE_RATE
+        fighter.update(inputs, scale)
+
+        # Shooting, both on key press and while the key is held
+        if inputs & INPUT_FIRE:
+            fighter.shoot(self.time, bullets)
+        profiler.mark("input")
+
+        # Spawn enemies
+        self.enemy_spawn_timer += scale
+        if self.enemy_spawn_timer >= 60:  # Spawn every 60 frames
+            enemies.acquire().reset(self.random)
+            self.enemy_spawn_timer = 0
+
+        # Move enemies and bullets, dropping the ones that left the screen
+        enemies.release_all([i for i, enemy in enumerate(enemies) if enemy.update(scale)])
+        bullets.release_all([i for i, bullet in enumerate(bullets) if bullet.update(scale)])
+        profiler.mark("update")
+
+        self.apply_collisions(find_collisions(fighter, enemies, bullets))
+        profiler.mark("collision")
+
         # Update particles
-        for particle in particles[:]:
-            if particle.update():
-                particles.remove(particle)
-    
-    # Update stars
-    for star in stars:
-        star.update()
-    
-    # Drawing
-    screen.fill(BLACK)
+        particles.update(scale)
+        profiler.mark("particles")
+
+def read_input(keys, events):
+    inputs = 0
+    if keys[pygame.K_LEFT]:
+        inputs |= INPUT_LEFT
+    if keys[pygame.K_RIGHT]:
+        inputs |= INPUT_RIGHT
+    if keys[pygame.K_UP]:
+        inputs |= INPUT_UP
+    if keys[pygame.K_DOWN]:
+        inputs |= INPUT_DOWN
+    if keys[pygame.K_SPACE]:
+        inputs |= INPUT_FIRE
+    for event in events:
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_SPACE:
+                inputs |= INPUT_FIRE
+            if event.key == pygame.K_r:
+                inputs |= INPUT_RESTART
+    return inputs
+
+def demo_input(frame):
+    # Scripted input for windowless runs: keep firing and sweep sideways
+    inputs = INPUT_FIRE
+    inputs |= INPUT_LEFT if (frame // 60) % 2 else INPUT_RIGHT
+    if frame % 600 == 0:
+        inputs |= INPUT_RESTART
+    return inputs
+
+def run_headless(frames, seed=0):
+    world = World(seed)
+    dt = 1 / 60
+    start = time.perf_counter()
+    for frame in range(frames):
+        world.step(demo_input(frame), dt)
+    return world, time.perf_counter() - start
+
+class Hud:
+    def __init__(self, font):
+        self.font = font
+        self.health = HudNumber(font, "سلامت: {}", GREEN)
+        self.score = HudNumber(font, "امتیاز: {}", YELLOW)
+
+    def text(self, text, color):
+        return text_cache.render(self.font, text, True, color)
+
+def interpolate(entity, alpha):
+    # Where to draw an entity between its last two simulation steps
+    x, y = entity.last
+    return (round(x + (entity.x - x) * alpha), round(y + (entity.y - y) * alpha))
+
+def apply_quality(level, world, stars, simulation=True):
+    # The particle burst draws on the world's RNG, so it only changes when
+    # `simulation` is true; recordings keep it fixed to stay replayable
+    burst, star_layers = QUALITY_LEVELS[level]
+    stars.shown_layers = min(star_layers, len(stars.layers))
+    if simulation:
+        world.particle_burst = burst
+
+def draw_world(screen, world, stars, hud, profiler=NULL_PROFILER, alpha=1.0):
+    # Draws the frame over whatever is on screen and returns the rects touched
+    fighter = world.fighter
     
     # Draw stars
-    for star in stars:
-        star.draw(screen)
+    rects = stars.draw(screen)
     
     # Draw game objects
-    if not game_over:
-        fighter.draw(screen)
-        for enemy in enemies:
-            enemy.draw(screen)
-        for bullet in bullets:
-            bullet.draw(screen)
+    if not world.game_over:
+        sheet = sprites.surface()
+        blits = [(sheet, interpolate(fighter, alpha), fighter.area)]
+        blits += [(sheet, interpolate(enemy, alpha), enemy.area) for enemy in world.enemies]
+        blits += [(sheet, interpolate(bullet, alpha), bullet.area) for bullet in world.bullets]
+        rects += screen.blits(blits)
     
     # Draw particles
-    for particle in particles:
-        particle.draw(screen)
+    rects += world.particles.draw(screen)
+    profiler.mark("draw")
     
     # Draw HUD
-    health_text = font.render(f"سلامت: {fighter.health}", True, GREEN)
-    score_text = font.render(f"امتیاز: {score}", True, YELLOW)
-    screen.blit(health_text, (10, 10))
-    screen.blit(score_text, (10, 50))
+    health_text = hud.health.render(fighter.health)
+    score_text = hud.score.render(world.score)
     
     # Draw controls info
-    controls_text = font.render("جهت‌ها: حرکت | فاصله: شلیک", True, WHITE)
-    screen.blit(controls_text, (WIDTH - controls_text.get_width() - 10, 10))
+    controls_text = hud.text("جهت‌ها: حرکت | فاصله: شلیک", WHITE)
+    rects += screen.blits([
+        (health_text, (10, 10)),
+        (score_text, (10, 50)),
+        (controls_text, (WIDTH - controls_text.get_width() - 10, 10)),
+    ])
     
     # Game over screen
-    if game_over:
+    if world.game_over:
         overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
         overlay.fill((0, 0, 0, 180))
-        screen.blit(overlay, (0, 0))
+        rects.append(screen.blit(overlay, (0, 0)))
         
-        game_over_text = font.render("بازی تمام شد!", True, RED)
-        final_score_text = font.render(f"امتیاز نهایی: {score}", True, YELLOW)
-        restart_text = font.render("برای شروع مجدد R را فشار دهید", True, GREEN)
+        game_over_text = hud.text("بازی تمام شد!", RED)
+        final_score_text = hud.text(f"امتیاز نهایی: {world.score}", YELLOW)
+        restart_text = hud.text("برای شروع مجدد R را فشار دهید", GREEN)
         
-        screen.blit(game_over_text, (WIDTH//2 - game_over_text.get_width()//2, HEIGHT//2 - 50))
-        screen.blit(final_score_text, (WIDTH//2 - final_score_text.get_width()//2, HEIGHT//2))
-        screen.blit(restart_text, (WIDTH//2 - restart_text.get_width()//2, HEIGHT//2 + 50))
+        rects += screen.blits([
+            (game_over_text, (WIDTH//2 - game_over_text.get_width()//2, HEIGHT//2 - 50)),
+            (final_score_text, (WIDTH//2 - final_score_text.get_width()//2, HEIGHT//2)),
+            (restart_text, (WIDTH//2 - restart_text.get_width()//2, HEIGHT//2 + 50)),
+        ])
     
-    pygame.display.flip()
-    clock.tick(60)
+    # Frame time overlay; changes every refresh, so it is not cached
+    if profiler.show_overlay:
+        for i, line in enumerate(profiler.overlay_lines()):
+            text = hud.font.render(line, True, WHITE)
+            rects.append(screen.blit(text, (10, HEIGHT - 30 * (2 - i) - 10)))
+    profiler.mark("hud")
+    return rects
+
+class FullRenderer:
+    def __init__(self, screen, profiler=NULL_PROFILER):
+        self.screen = screen
+        self.profiler = profiler
+
+    def present(self, world, stars, hud, alpha=1.0):
+        self.screen.fill(BLACK)
+        draw_world(self.screen, world, stars, hud, self.profiler, alpha)
+        pygame.display.flip()
+        self.profiler.mark("flip")
+
+class DirtyRectRenderer:
+    # Clears only last frame's rects, draws the new frame and presents the
+    # old and new rects with display.update(). Falls back to a full flip
+    # when the dirty area exceeds `max_dirty_fraction` of the window, and
+    # on the game over screen, whose overlay covers everything.
+    def __init__(self, screen, max_dirty_fraction=0.4, profiler=NULL_PROFILER):
+        self.screen = screen
+        self.profiler = profiler
+        self.max_dirty_area = max_dirty_fraction * WIDTH * HEIGHT
+        self.previous = None
+        self.full_flips = 0
+
+    def present(self, world, stars, hud, alpha=1.0):
+        screen = self.screen
+        if self.previous is None or world.game_over:
+            screen.fill(BLACK)
+            drawn = draw_world(screen, world, stars, hud, self.profiler, alpha)
+            pygame.display.flip()
+            self.profiler.mark("flip")
+            self.full_flips += 1
+            self.previous = None if world.game_over else drawn
+            return
+
+        for rect in self.previous:
+            screen.fill(BLACK, rect)
+        drawn = draw_world(screen, world, stars, hud, self.profiler, alpha)
+        dirty = self.previous + drawn
+        self.previous = drawn
+
+        if sum(rect.width * rect.height for rect in dirty) > self.max_dirty_area:
+            pygame.display.flip()
+            self.full_flips += 1
+        else:
+            pygame.display.update(dirty)
+        self.profiler.mark("flip")
+
+def main():
+    parser = argparse.ArgumentParser(description="Modern Fighter")
+    parser.add_argument("--headless", type=int, metavar="FRAMES",
+                        help="run FRAMES simulation steps without a window and exit")
+    parser.add_argument("--seed", type=int,
+                        help="RNG seed (headless runs default to 0, games to a random one)")
+    parser.add_argument("--dirty-rects", action="store_true",
+                        help="present only the changed regions of each frame")
+    parser.add_argument("--record", metavar="FILE",
+                        help="write the seed and every simulation step's input to FILE")
+    parser.add_argument("--tick-rate", type=int, default=BASE_RATE,
+                        help="simulation steps per second, independent of the frame rate")
+    parser.add_argument("--max-catch-up", type=int, default=MAX_CATCH_UP,
+                        help="most simulation steps run in one frame after a stall")
+    parser.add_argument("--uncapped", action="store_true",
+                        help="render as fast as possible instead of at 60 fps")
+    parser.add_argument("--vsync", action="store_true",
+                        help="pace frames by the display's refresh instead of a timer")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="replay a recorded session without a window and verify it")
+    parser.add_argument("--fade-particles", action="store_true",
+                        help="blend particles over the background as they burn out")
+    parser.add_argument("--additive-particles", action="store_true",
+                        help="add particle colours to the background instead of covering it")
+    parser.add_argument("--startup-time", action="store_true",
+                        help="print how long the first frame took to appear, by phase")
+    parser.add_argument("--frame-budget", type=float, metavar="MS",
+                        help="lower the effects when frames take longer than MS milliseconds "
+                             "(default 16.7, or off with --vsync; 0 turns it off)")
+    args = parser.parse_args()
+
+    if args.headless:
+        world, elapsed = run_headless(args.headless, args.seed or 0)
+        print(f"{args.headless} frames in {elapsed:.2f}s "
+              f"({args.headless / elapsed:.0f} frames/s), score {world.score}")
+        return
+
+    if args.replay:
+        world, frames, elapsed, verified = replay(args.replay, "app", World)
+        print(summary(frames, elapsed, verified))
+        sys.exit(1 if verified is False else 0)
+
+    seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+
+    startup.report = args.startup_time
+    startup.mark("imports")
+
+    # Only the display is started; the font module starts with the first font
+    init_pygame("display")
+    try:
+        # vsync needs a hardware-accelerated renderer; not every driver has one
+        screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.SCALED if args.vsync else 0,
+                                         vsync=int(args.vsync))
+    except pygame.error:
+        screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("جنگنده مدرن - Modern Fighter")
+    startup.mark("display")
+
+    # Game setup
+    world = World(seed)
+    world.particles.fade = args.fade_particles
+    world.particles.additive = args.additive_particles
+    stars = StarField(track_rects=args.dirty_rects)
+    hud = Hud(sys_font(None, 36))
+    profiler = profiler_from_env()
+    world.profiler = profiler
+    if args.dirty_rects:
+        renderer = DirtyRectRenderer(screen, profiler=profiler)
+    else:
+        renderer = FullRenderer(screen, profiler)
+    recorder = Recorder(args.record, "app", seed) if args.record else NULL_RECORDER
+    recorder.begin_world(world)
+    startup.mark("setup")
+
+    # The governor picks the quality level from measured frame times. With
+    # vsync the wait for the display is inside flip, so every frame would
+    # look over budget; it is off there unless a budget is given.
+    budget = args.frame_budget
+    if budget is None:
+        budget = 0 if args.vsync else 1000 / 60
+    governor = governor_from_budget(budget, len(QUALITY_LEVELS))
+    simulation = not recorder.enabled
+    apply_quality(governor.level, world, stars, simulation)
+
+    # Main game loop: the simulation runs in fixed steps, rendering as often
+    # as the frame cap (none with --uncapped or --vsync) allows
+    clock = pygame.time.Clock()
+    max_fps = 0 if args.uncapped or args.vsync else 60
+    timestep = FixedTimestep(args.tick_rate, args.max_catch_up)
+    running = True
+
+    while running:
+        profiler.begin_frame()
+        governor.begin_frame()
+
+        # Event handling
+        events = pygame.event.get()
+        for event in events:
+            if event.type == pygame.QUIT:
+                running = False
+        profiler.mark("events")
+
+        for inputs in timestep.steps(read_input(pygame.key.get_pressed(), events)):
+            recorder.record(inputs, timestep.dt)
+            world.step(inputs, timestep.dt)
+
+        # Stars are scenery and move with real time
+        stars.update(timestep.frame_time * BASE_RATE)
+
+        renderer.present(world, stars, hud, timestep.alpha)
+        startup.first_frame()
+        # Time spent sleeping in clock.tick is not part of the frame's cost
+        if governor.end_frame():
+            apply_quality(governor.level, world, stars, simulation)
+        clock.tick(max_fps)
+        profiler.mark("tick")
+        profiler.end_frame(enemies=len(world.enemies), bullets=len(world.bullets),
+                           particles=len(world.particles), stars=len(stars),
+                           quality=governor.level)
+
+    recorder.close()
+    pygame.quit()
+    sys.exit()
 
-pygame.quit()
-sys.exit()
+if __name__ == "__main__":
+    main()
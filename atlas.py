@@ -0,0 +1,174 @@
+import argparse
+import json
+import mmap
+import os
+
+import pygame
+
+from startup import cache_dir
+
+# Pixels are stored in the byte order of the usual 32-bit display format
+# (ARGB8888, little-endian), so the mapped surface blits without conversion
+FORMAT = "BGRA"
+WIDTH = 256
+PADDING = 1
+
+
+def pack(sizes, width=WIDTH, padding=PADDING):
+    # Shelf packing, tallest first: each sprite goes to the right of the
+    # previous one, and a new row starts when the current one is full.
+    # Returns {name: Rect} and the height used.
+    rects = {}
+    x = y = row = 0
+    for name, (w, h) in sorted(sizes.items(), key=lambda item: (-item[1][1], item[0])):
+        if w > width:
+            raise ValueError(f"sprite {name!r} is wider than the atlas ({w} > {width})")
+        if x + w > width:
+            x, y, row = 0, y + row + padding, 0
+        rects[name] = pygame.Rect(x, y, w, h)
+        x += w + padding
+        row = max(row, h)
+    return rects, y + row
+
+
+def sources_fingerprint(paths):
+    # The atlas is rebaked when a file that draws its sprites changes
+    entries = [pygame.version.ver, FORMAT, WIDTH, PADDING]
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            entries.append((os.path.abspath(path), stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            entries.append((path, None))
+    return repr(entries)
+
+
+def write_replace(path, data, mode="wb"):
+    # Write to a temporary file and rename it over `path`, so a process
+    # starting at the same time never maps a half-written atlas
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, mode) as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def bake(factories, pixels_path, index_path, fingerprint):
+    # Draw every sprite once, pack them onto one surface and write its raw
+    # pixels plus a JSON index of where each sprite is. Returns the sheet
+    # and the index.
+    surfaces = {name: factory() for name, factory in factories.items()}
+    rects, height = pack({name: surface.get_size() for name, surface in surfaces.items()})
+    sheet = pygame.Surface((WIDTH, max(height, 1)), pygame.SRCALPHA)
+    for name, surface in surfaces.items():
+        sheet.blit(surface, rects[name])
+    index = {
+        "fingerprint": fingerprint,
+        "size": list(sheet.get_size()),
+        "format": FORMAT,
+        "sprites": {name: list(rect) for name, rect in rects.items()},
+    }
+    try:
+        os.makedirs(os.path.dirname(pixels_path), exist_ok=True)
+        write_replace(pixels_path, pygame.image.tobytes(sheet, FORMAT))
+        # The index goes last: a valid index means the pixels are complete
+        write_replace(index_path, json.dumps(index, indent=1), "w")
+    except OSError:
+        pass
+    return sheet, index
+
+
+class Atlas:
+    # Procedural sprites baked once into a packed file and memory-mapped on
+    # later launches. The mapped pixels back the sheet surface directly, so
+    # loading neither draws nor copies anything. Entities keep the sub-rect
+    # from area(name) and blit the sheet with it as the source area.
+    # `factories` maps sprite names to functions that draw them; a change
+    # to any of the `sources` files, or a missing or unreadable file, bakes
+    # the atlas again.
+    def __init__(self, name, factories, sources=(), directory=None):
+        self.name = name
+        self.factories = factories
+        self.sources = sources
+        self.directory = directory
+        self.rects = None
+        self.sheet = None
+        self.buffer = None
+        self.baked = False
+        self.converted = False
+
+    def paths(self):
+        directory = self.directory or cache_dir()
+        return (os.path.join(directory, f"{self.name}.{FORMAT.lower()}"),
+                os.path.join(directory, f"{self.name}.json"))
+
+    def load(self):
+        pixels_path, index_path = self.paths()
+        fingerprint = sources_fingerprint(self.sources)
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+            if (index["fingerprint"] != fingerprint or index["format"] != FORMAT
+                    or set(index["sprites"]) != set(self.factories)):
+                raise ValueError("stale atlas")
+            size = tuple(index["size"])
+            with open(pixels_path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if len(buffer) != size[0] * size[1] * 4:
+                buffer.close()
+                raise ValueError("truncated atlas")
+        except (OSError, ValueError, KeyError):
+            self.sheet, index = bake(self.factories, pixels_path, index_path, fingerprint)
+            self.baked = True
+        else:
+            # The surface keeps referring to the mapping; it must stay open
+            self.buffer = buffer
+            self.sheet = pygame.image.frombuffer(buffer, size, FORMAT)
+        self.rects = {name: pygame.Rect(rect) for name, rect in index["sprites"].items()}
+
+    def area(self, name):
+        # Where sprite `name` is on the sheet
+        if self.rects is None:
+            self.load()
+        return self.rects[name]
+
+    def surface(self):
+        # The sheet, matched to the display's pixel format once there is a
+        # display (a copy only if the display is not ARGB8888)
+        if self.sheet is None:
+            self.load()
+        display = pygame.display.get_surface()
+        if not self.converted and display is not None:
+            if display.get_bitsize() != 32 or display.get_masks()[:3] != self.sheet.get_masks()[:3]:
+                self.sheet = self.sheet.convert_alpha()
+            self.converted = True
+        return self.sheet
+
+    def subsurface(self, name):
+        # A surface for APIs that need one (the window icon), sharing the
+        # sheet's pixels as they are on disk
+        area = self.area(name)
+        return self.sheet.subsurface(area)
+
+
+def main():
+    # Bake both games' atlases ahead of time, e.g. while packaging
+    parser = argparse.ArgumentParser(description="Bake the sprite atlases of both games")
+    parser.add_argument("--directory", help="where to write them (default: the cache directory)")
+    args = parser.parse_args()
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import app
+    import mortza
+    for atlas in (app.sprites, mortza.sprites):
+        atlas.directory = args.directory or atlas.directory
+        for path in atlas.paths():
+            if os.path.exists(path):
+                os.remove(path)
+        atlas.load()
+        pixels_path, _ = atlas.paths()
+        print(f"{atlas.name}: {len(atlas.rects)} sprites, "
+              f"{atlas.sheet.get_width()}x{atlas.sheet.get_height()} -> {pixels_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+import argparse
+import ctypes.util
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+# No window: SDL's dummy driver for pygame, and a surfaceless EGL context
+# (Mesa's llvmpipe on machines without a GPU) for the OpenGL game. Both
+# must be chosen before pygame and PyOpenGL are imported.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+if ctypes.util.find_library("EGL"):
+    os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+    os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+
+import numpy as np
+import pygame
+
+import app
+import mortza
+from fonts import sys_font
+from profiler import FrameProfiler
+
+STEP = 1 / 60
+
+
+class Scenario:
+    # A seeded stress test: tick(world, frame) runs before every step, keeps
+    # the load topped up and returns that frame's input bits.
+    def __init__(self, name, game, tick, stars=None):
+        self.name = name
+        self.game = game
+        self.tick = tick
+        self.stars = stars
+
+
+def no_input(world, frame):
+    return 0
+
+
+# app.py scenarios
+
+def app_enemies(world, frame, count=1000):
+    # Refill the field every frame and keep the fighter alive
+    world.fighter.health = 10 ** 9
+    while len(world.enemies) < count:
+        enemy = world.enemies.acquire()
+        enemy.reset(world.random)
+        enemy.y = enemy.rect.y = world.random.randint(-40, app.HEIGHT - 40)
+        enemy.last = (enemy.x, enemy.y)
+    return 0
+
+
+def app_particles(world, frame, count=20000):
+    while len(world.particles) < count:
+        world.particles.emit(world.random.randint(0, app.WIDTH),
+                             world.random.randint(0, app.HEIGHT), world.random, 1)
+    return 0
+
+
+def app_bullet_storm(world, frame):
+    world.fighter.shoot_delay = 10
+    world.fighter.health = 10 ** 9
+    return app.INPUT_FIRE | (app.INPUT_LEFT if (frame // 60) % 2 else app.INPUT_RIGHT)
+
+
+# mortza.py scenarios
+
+def mortza_enemies(world, frame, count=1000):
+    world.player.lives = 10 ** 9
+    while len(world.enemies) < count:
+        world.entities.spawn_enemy(world.wave, world.random)
+    return 0
+
+
+def mortza_particles(world, frame, count=20000):
+    rng = world.random
+    while len(world.particles) < count:
+        world.particles.emit(rng.uniform(-20, 20), rng.uniform(-5, 5), rng.uniform(-40, 0),
+                             rng.choice(mortza.ENEMY_COLORS))
+    return 0
+
+
+def mortza_bullet_storm(world, frame):
+    world.player.shoot_delay = 10
+    world.player.lives = 10 ** 9
+    return mortza.demo_input(frame)
+
+
+SCENARIOS = [
+    Scenario("app/enemies_1000", "app", app_enemies),
+    Scenario("app/particles_20k", "app", app_particles),
+    Scenario("app/bullet_storm", "app", app_bullet_storm),
+    Scenario("app/stars_200", "app", no_input, stars=200),
+    Scenario("app/stars_20k", "app", no_input, stars=20000),
+    Scenario("mortza/enemies_1000", "mortza", mortza_enemies),
+    Scenario("mortza/particles_20k", "mortza", mortza_particles),
+    Scenario("mortza/bullet_storm", "mortza", mortza_bullet_storm),
+    Scenario("mortza/stars_200", "mortza", no_input, stars=200),
+    Scenario("mortza/stars_20k", "mortza", no_input, stars=20000),
+]
+
+
+def create_gl_context(width, height):
+    # Offscreen OpenGL context through EGL; None if there is no EGL
+    if os.environ.get("PYOPENGL_PLATFORM") != "egl":
+        return None
+    try:
+        from OpenGL import EGL
+        display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        if not EGL.eglInitialize(display, None, None):
+            return None
+        attributes = (EGL.EGLint * 13)(
+            EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT, EGL.EGL_RED_SIZE, 8,
+            EGL.EGL_ALPHA_SIZE, 8, EGL.EGL_DEPTH_SIZE, 24,
+            EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT, EGL.EGL_NONE, 0, 0)
+        config = EGL.EGLConfig()
+        found = EGL.EGLint()
+        EGL.eglChooseConfig(display, attributes, ctypes.pointer(config), 1, ctypes.pointer(found))
+        if not found.value:
+            return None
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        context = EGL.eglCreateContext(display, config, EGL.EGL_NO_CONTEXT, None)
+        size = (EGL.EGLint * 5)(EGL.EGL_WIDTH, width, EGL.EGL_HEIGHT, height, EGL.EGL_NONE)
+        surface = EGL.eglCreatePbufferSurface(display, config, size)
+        if not EGL.eglMakeCurrent(display, surface, surface, context):
+            return None
+    except Exception as error:
+        print(f"no offscreen GL context ({error})", file=sys.stderr)
+        return None
+
+    from OpenGL.GL import GL_RENDERER, GL_VERSION, glGetString
+    return f"{glGetString(GL_RENDERER).decode()} / {glGetString(GL_VERSION).decode()}"
+
+
+class AppView:
+    # Draws app.py frames to the dummy display, as main() does
+    def __init__(self, stars):
+        self.screen = pygame.display.get_surface()
+        self.stars = app.StarField(stars)
+        self.hud = app.Hud(sys_font(None, 36))
+        self.renderer = None
+
+    def prepare(self, world, profiler):
+        self.renderer = app.FullRenderer(self.screen, profiler)
+
+    def draw(self, world, profiler):
+        self.stars.update()
+        self.renderer.present(world, self.stars, self.hud)
+
+    def counts(self):
+        return {}
+
+
+class MortzaView:
+    # Draws mortza.py's 3D scene into the offscreen context, or nothing if
+    # there is none; glFinish stands in for the buffer swap
+    def __init__(self, stars, gl):
+        self.stars = mortza.StarField(stars)
+        self.gl = gl
+        self.culling = mortza.CullStats()
+
+    def prepare(self, world, profiler):
+        pass
+
+    def draw(self, world, profiler):
+        self.stars.update()
+        if not self.gl:
+            return
+        mortza.draw_scene(world, self.stars, stats=self.culling)
+        profiler.mark("draw")
+        mortza.glFinish()
+        profiler.mark("flip")
+
+    def counts(self):
+        return self.culling.counts() if self.gl else {}
+
+
+def run_frames(scenario, world, view, profiler, frames, first_frame):
+    # The scenario tops the load up before each frame starts, so its cost
+    # is not part of the frame; the seconds it took are returned instead
+    world.profiler = profiler
+    view.prepare(world, profiler)
+    refill = 0.0
+    for frame in range(first_frame, first_frame + frames):
+        start = time.perf_counter()
+        inputs = scenario.tick(world, frame)
+        refill += time.perf_counter() - start
+        profiler.begin_frame()
+        world.step(inputs, STEP)
+        view.draw(world, profiler)
+        profiler.end_frame(enemies=len(world.enemies), bullets=len(world.bullets),
+                           particles=len(world.particles), **view.counts())
+    return refill
+
+
+def run_scenario(scenario, frames, warmup, trace_frames, seed, gl):
+    # The star fields and the bursts of global-RNG code are seeded too, so
+    # every run of a scenario sees the same frames
+    random.seed(seed)
+    np.random.seed(seed)
+    module = app if scenario.game == "app" else mortza
+    world = module.World(seed)
+    default_stars = app.STAR_COUNT if scenario.game == "app" else mortza.STAR_COUNT
+    stars = scenario.stars or default_stars
+    if scenario.game == "app":
+        view = AppView(stars)
+    else:
+        view = MortzaView(stars, gl)
+
+    # Warm-up frames fill the pools and caches before anything is timed
+    run_frames(scenario, world, view, FrameProfiler(max(warmup, 1)), warmup, 0)
+
+    profiler = FrameProfiler(frames)
+    start = time.perf_counter()
+    refill = run_frames(scenario, world, view, profiler, frames, warmup)
+    elapsed = time.perf_counter() - start - refill
+
+    # Allocations are measured on a separate, shorter pass since tracing
+    # slows everything down too much to time at the same time
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    run_frames(scenario, world, view, FrameProfiler(trace_frames), trace_frames,
+               warmup + frames)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    ranks = profiler.percentiles()
+    return {
+        "frames": frames,
+        "fps": frames / elapsed,
+        "frame_ms": {f"p{rank}": value * 1000 for rank, value in ranks.items()},
+        "mean_ms": elapsed / frames * 1000,
+        "refill_ms": refill / frames * 1000,
+        "phases_ms": {phase: mean * 1000 for phase, mean in profiler.phase_means().items()},
+        "alloc_peak_kb": (peak - before) / 1024,
+        "alloc_net_kb_per_frame": (after - before) / 1024 / trace_frames,
+        "entities": profiler.counts[(profiler.frames - 1) % profiler.capacity],
+        "stars": stars,
+        "drawn": scenario.game == "app" or bool(gl),
+    }
+
+
+def compare(results, baseline, threshold):
+    # Mean frame time against the baseline; a scenario regresses when it is
+    # slower by more than `threshold` (a fraction)
+    regressions = []
+    for name, result in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            print(f"{name:24} {result['mean_ms']:9.3f} ms   (no baseline)")
+            continue
+        change = result["mean_ms"] / base["mean_ms"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:24} {result['mean_ms']:9.3f} ms   baseline {base['mean_ms']:9.3f} ms"
+              f"   {change:+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seeded stress scenarios for both games")
+    parser.add_argument("--frames", type=int, default=300, help="timed frames per scenario")
+    parser.add_argument("--warmup", type=int, default=60)
+    parser.add_argument("--trace-frames", type=int, default=30,
+                        help="frames run under tracemalloc to measure allocations")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", metavar="TEXT", help="run scenarios whose name contains TEXT")
+    parser.add_argument("--no-gl", action="store_true",
+                        help="skip the OpenGL context; mortza scenarios run the simulation only")
+    parser.add_argument("--output", default="bench.json")
+    parser.add_argument("--baseline", metavar="FILE", help="compare against an earlier --output")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="allowed slowdown before a scenario counts as a regression")
+    args = parser.parse_args()
+
+    scenarios = [s for s in SCENARIOS if not args.only or args.only in s.name]
+
+    pygame.init()
+    pygame.display.set_mode((app.WIDTH, app.HEIGHT))
+    gl = None
+    if not args.no_gl and any(s.game == "mortza" for s in scenarios):
+        gl = create_gl_context(mortza.WIDTH, mortza.HEIGHT)
+        if gl:
+            mortza.init_gl()
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "gl": gl,
+            "seed": args.seed,
+        },
+        "scenarios": {},
+    }
+    for scenario in scenarios:
+        result = run_scenario(scenario, args.frames, args.warmup, args.trace_frames,
+                              args.seed, gl)
+        results["scenarios"][scenario.name] = result
+        phases = sorted(result["phases_ms"].items(), key=lambda item: -item[1])
+        print(f"{scenario.name:24} {result['fps']:8.1f} fps  p50 {result['frame_ms']['p50']:7.2f} ms"
+              f"  p99 {result['frame_ms']['p99']:7.2f} ms  alloc peak {result['alloc_peak_kb']:8.1f} KB  "
+              + "  ".join(f"{phase} {ms:.2f}" for phase, ms in phases[:3] if ms > 0))
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=1)
+    pygame.quit()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print()
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} scenario(s) slower than {args.threshold:.0%} over baseline")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import numpy as np
+
+
+class Frustum:
+    # The six clip planes of a camera, taken from the rows of
+    # projection @ modelview (Gribb & Hartmann). Both matrices are
+    # row-major, as instanced.perspective and look_at build them. Planes are
+    # normalised, so a point's dot product with one is its signed distance
+    # in world units, positive on the inside.
+    def __init__(self, projection, modelview, viewport_height):
+        projection = np.asarray(projection, dtype=np.float64)
+        modelview = np.asarray(modelview, dtype=np.float64)
+        clip = projection @ modelview
+        planes = np.array([clip[3] + clip[0], clip[3] - clip[0],    # left, right
+                           clip[3] + clip[1], clip[3] - clip[1],    # bottom, top
+                           clip[3] + clip[2], clip[3] - clip[2]])   # near, far
+        planes /= np.linalg.norm(planes[:, :3], axis=1)[:, None]
+        # float32 like the entity arrays, so the plane tests do not upcast
+        self.normals = planes[:, :3].astype(np.float32)
+        self.offsets = planes[:, 3:].astype(np.float32)
+
+        # Camera position in world space, and the on-screen size in pixels
+        # of one world unit at distance 1
+        self.eye = (-modelview[:3, :3].T @ modelview[:3, 3]).astype(np.float32)
+        self.pixels_per_unit = projection[1, 1] * viewport_height / 2
+
+    def cull(self, centers, radii):
+        # Indices of the bounding spheres at least partly inside, and the
+        # radius in pixels of each of those at its distance from the camera
+        centers = np.reshape(centers, (-1, 3))
+        radii = np.asarray(radii)
+        # One (6, n) product is far faster than (n, 3) @ (3, 6) for large n
+        distances = self.normals @ centers.T
+        distances += self.offsets
+        distances += radii
+        visible = np.flatnonzero(distances.min(axis=0) >= 0)
+        offsets = centers[visible] - self.eye
+        distance = np.sqrt(np.einsum("ij,ij->i", offsets, offsets))
+        return visible, radii[visible] * self.pixels_per_unit / np.maximum(distance, 1e-6)
+
+
+class CullStats:
+    # What the culling stage kept and dropped in the current frame.
+    # `reduced` counts entities drawn below full detail.
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.drawn = 0
+        self.culled = 0
+        self.reduced = 0
+
+    def add(self, total, drawn, reduced=0):
+        self.drawn += drawn
+        self.culled += total - drawn
+        self.reduced += reduced
+
+    def counts(self):
+        return {"drawn": self.drawn, "culled": self.culled, "reduced": self.reduced}
+
+
+def cull_levels(frustum, centers, radii, thresholds, stats):
+    # Indices of the visible spheres, grouped by level of detail. An entity
+    # goes in group 0 if its on-screen radius is at least thresholds[0]
+    # pixels, in group 1 if at least thresholds[1], and so on; the last
+    # group gets the rest. With no frustum everything is drawn at full
+    # detail.
+    if frustum is None:
+        everything = np.arange(len(centers))
+        stats.add(len(everything), len(everything))
+        return [everything] + [everything[:0]] * len(thresholds)
+
+    visible, pixels = frustum.cull(centers, radii)
+    levels = np.searchsorted(-np.asarray(thresholds, dtype=np.float64), -pixels)
+    groups = [visible[levels == level] for level in range(len(thresholds) + 1)]
+    stats.add(len(centers), len(visible), len(visible) - len(groups[0]))
+    return groups
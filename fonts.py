@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import sys
+from collections import OrderedDict
+
+import pygame
+import pygame.sysfont
+
+from startup import cache_dir
+
+
+class TextCache:
+    # Rendered text surfaces keyed by (font, text, antialias, color), with
+    # the least recently used entries dropped past `maxsize`. Callers must
+    # not draw onto the returned surfaces, they are shared.
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.surfaces)
+
+    def render(self, font, text, antialias, color):
+        key = (font, text, antialias, tuple(color))
+        surf = self.surfaces.get(key)
+        if surf is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surf
+
+        self.misses += 1
+        surf = font.render(text, antialias, color)
+        self.surfaces[key] = surf
+        if len(self.surfaces) > self.maxsize:
+            self.surfaces.popitem(last=False)
+        return surf
+
+    def clear(self):
+        self.surfaces.clear()
+
+
+text_cache = TextCache()
+
+
+class HudNumber:
+    # A HUD label such as "Score: {}" that is only re-rendered when the
+    # value shown changes. Values change often enough that caching every
+    # one of them in TextCache would just churn it.
+    def __init__(self, font, template, color, antialias=True):
+        self.font = font
+        self.template = template
+        self.color = color
+        self.antialias = antialias
+        self.value = None
+        self.surface = None
+
+    def render(self, value):
+        if self.surface is None or value != self.value:
+            self.value = value
+            self.surface = self.font.render(self.template.format(value),
+                                            self.antialias, self.color)
+        return self.surface
+
+
+def font_dirs():
+    # Where the platform keeps installed fonts; a change in any of these
+    # (or their subdirectories) means a font was added or removed
+    home = os.path.expanduser("~")
+    if sys.platform == "win32":
+        return [os.path.join(os.environ.get("WINDIR", "C:\\Windows"), "Fonts"),
+                os.path.join(os.environ.get("LOCALAPPDATA", home), "Microsoft", "Windows", "Fonts")]
+    if sys.platform == "darwin":
+        return ["/System/Library/Fonts", "/Library/Fonts",
+                os.path.join(home, "Library", "Fonts")]
+    return ["/usr/share/fonts", "/usr/local/share/fonts",
+            os.path.join(home, ".fonts"), os.path.join(home, ".local", "share", "fonts")]
+
+
+def fonts_fingerprint(dirs):
+    # Digest of the modification times of every font directory. Only the
+    # directories are stat'ed, not the font files in them.
+    entries = [pygame.version.ver]
+    for root in dirs:
+        for path, _, _ in os.walk(root):
+            try:
+                entries.append((path, os.stat(path).st_mtime_ns))
+            except OSError:
+                pass
+    return hashlib.sha1(repr(entries).encode()).hexdigest()
+
+
+def default_cache_path():
+    # GAME_FONT_CACHE overrides the file in the shared cache directory
+    return os.environ.get("GAME_FONT_CACHE") or os.path.join(cache_dir(), "fonts.json")
+
+
+class FontPathCache:
+    # What SysFont resolved each (name, bold, italic) to: the font file and
+    # whether bold/italic have to be faked. Kept on disk so later launches
+    # skip pygame's scan of the installed fonts (fc-list, the registry or
+    # system_profiler), and thrown away when the font directories change.
+    def __init__(self, path, dirs=None):
+        self.path = path
+        self.dirs = dirs
+        self.entries = None
+        self.fingerprint = None
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        self.fingerprint = fonts_fingerprint(font_dirs() if self.dirs is None else self.dirs)
+        self.entries = {}
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("fingerprint") == self.fingerprint:
+            self.entries = data.get("fonts", {})
+
+    def save(self):
+        # A cache that cannot be written only costs the next launch a scan
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "w") as f:
+                json.dump({"fingerprint": self.fingerprint, "fonts": self.entries}, f, indent=1)
+        except OSError:
+            pass
+
+    def resolve(self, name, bold=False, italic=False):
+        # (font file or None for pygame's default font, fake bold, fake italic)
+        if self.entries is None:
+            self.load()
+        key = f"{name}|{int(bold)}|{int(italic)}"
+        entry = self.entries.get(key)
+        if entry is not None and (entry[0] is None or os.path.exists(entry[0])):
+            self.hits += 1
+            return tuple(entry)
+
+        self.misses += 1
+        entry = pygame.sysfont.SysFont(name, 0, bold, italic,
+                                       constructor=lambda path, size, bold, italic:
+                                       (path, bold, italic))
+        self.entries[key] = list(entry)
+        self.save()
+        return entry
+
+
+font_paths = FontPathCache(default_cache_path())
+
+
+def sys_font(name, size, bold=False, italic=False):
+    # pygame.font.SysFont with the file lookup cached on disk. The font
+    # module is started here on first use rather than by pygame.init().
+    if not pygame.font.get_init():
+        pygame.font.init()
+    if not name:
+        path, set_bold, set_italic = None, bold, italic
+    else:
+        path, set_bold, set_italic = font_paths.resolve(name, bold, italic)
+    return pygame.sysfont.font_constructor(path, size, set_bold, set_italic)
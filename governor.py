@@ -0,0 +1,79 @@
+import time
+
+# Each game lists its effect settings per quality level, lowest first; the
+# governor only decides which level is current.
+DEGRADE_ABOVE = 1.0
+RESTORE_BELOW = 0.7
+SMOOTHING = 0.05
+HOLD_FRAMES = 45
+
+
+class NullGovernor:
+    # Stand-in when the governor is off: always the top level
+    enabled = False
+
+    def __init__(self, levels=1):
+        self.level = levels - 1
+
+    def begin_frame(self):
+        pass
+
+    def end_frame(self):
+        return False
+
+
+class FrameGovernor:
+    # Keeps an exponential moving average of the time frames take from
+    # begin_frame() to end_frame() and compares it with `budget` seconds.
+    # Above budget * degrade_above the quality level drops one step, below
+    # budget * restore_below it rises one step; in between nothing changes,
+    # so a level that fits the budget is not immediately given up again.
+    # After every change the level is held for `hold` frames while the
+    # average settles on the new cost.
+    enabled = True
+
+    def __init__(self, budget, levels, smoothing=SMOOTHING, degrade_above=DEGRADE_ABOVE,
+                 restore_below=RESTORE_BELOW, hold=HOLD_FRAMES, clock=time.perf_counter):
+        self.budget = budget
+        self.levels = levels
+        self.level = levels - 1
+        self.smoothing = smoothing
+        self.degrade_above = degrade_above
+        self.restore_below = restore_below
+        self.hold = hold
+        self.clock = clock
+        self.average = None
+        self.wait = hold
+        self.changes = 0
+        self.start = clock()
+
+    def begin_frame(self):
+        self.start = self.clock()
+
+    def end_frame(self):
+        # True when the quality level changed
+        frame_time = self.clock() - self.start
+        if self.average is None:
+            self.average = frame_time
+        else:
+            self.average += (frame_time - self.average) * self.smoothing
+
+        if self.wait > 0:
+            self.wait -= 1
+            return False
+        if self.average > self.budget * self.degrade_above and self.level > 0:
+            self.level -= 1
+        elif self.average < self.budget * self.restore_below and self.level < self.levels - 1:
+            self.level += 1
+        else:
+            return False
+        self.wait = self.hold
+        self.changes += 1
+        return True
+
+
+def governor_from_budget(budget_ms, levels):
+    # A budget of 0 turns the governor off
+    if not budget_ms:
+        return NullGovernor(levels)
+    return FrameGovernor(budget_ms / 1000, levels)
@@ -0,0 +1,218 @@
+import ctypes
+import sys
+
+import numpy as np
+from OpenGL.GL import *
+
+# Per-vertex mesh attributes are 0-1, per-instance attributes 2-4
+ATTRIBUTES = {"position": 0, "normal": 1, "offset_scale": 2, "color": 3, "yaw": 4}
+
+# offset xyz + scale, rgba, cos/sin of the rotation about Y
+INSTANCE_FLOATS = 4 + 4 + 2
+
+VERTEX_SHADER = """
+#version 130
+uniform mat4 projection;
+uniform mat4 view;
+uniform bool lit;
+uniform vec3 light_dir;
+
+in vec3 position;
+in vec3 normal;
+in vec4 offset_scale;
+in vec4 color;
+in vec2 yaw;
+
+out vec4 frag_color;
+
+vec3 rotate_y(vec3 v) {
+    return vec3(v.x * yaw.x + v.z * yaw.y, v.y, -v.x * yaw.y + v.z * yaw.x);
+}
+
+void main() {
+    vec3 world = rotate_y(position * offset_scale.w) + offset_scale.xyz;
+    gl_Position = projection * view * vec4(world, 1.0);
+    if (lit) {
+        // Same result as the fixed-function light: 0.2 global + 0.2 light
+        // ambient, plus a white directional diffuse term in eye space
+        vec3 n = normalize(mat3(view) * rotate_y(normal));
+        frag_color = vec4(color.rgb * (0.4 + max(dot(n, light_dir), 0.0)), color.a);
+    } else {
+        frag_color = color;
+    }
+}
+"""
+
+FRAGMENT_SHADER = """
+#version 130
+in vec4 frag_color;
+
+void main() {
+    gl_FragColor = frag_color;
+}
+"""
+
+
+def perspective(fovy, aspect, near, far):
+    # Same matrix as gluPerspective, row-major
+    f = 1.0 / np.tan(np.radians(fovy) / 2)
+    return np.array([
+        [f / aspect, 0, 0, 0],
+        [0, f, 0, 0],
+        [0, 0, (far + near) / (near - far), 2 * far * near / (near - far)],
+        [0, 0, -1, 0],
+    ], dtype=np.float32)
+
+
+def look_at(eye, target, up):
+    # Same matrix as gluLookAt, row-major
+    eye = np.asarray(eye, dtype=np.float64)
+    forward = np.asarray(target, dtype=np.float64) - eye
+    forward /= np.linalg.norm(forward)
+    side = np.cross(forward, up)
+    side /= np.linalg.norm(side)
+    up = np.cross(side, forward)
+    view = np.identity(4)
+    view[0, :3] = side
+    view[1, :3] = up
+    view[2, :3] = -forward
+    view[:3, 3] = -view[:3, :3] @ eye
+    return view.astype(np.float32)
+
+
+def gl_version():
+    version = glGetString(GL_VERSION)
+    if not version:
+        return (0, 0)
+    numbers = version.split()[0].split(b".")
+    return int(numbers[0]), int(numbers[1])
+
+
+def compile_program(vertex_source, fragment_source):
+    program = glCreateProgram()
+    for kind, source in ((GL_VERTEX_SHADER, vertex_source),
+                         (GL_FRAGMENT_SHADER, fragment_source)):
+        shader = glCreateShader(kind)
+        glShaderSource(shader, source)
+        glCompileShader(shader)
+        if not glGetShaderiv(shader, GL_COMPILE_STATUS):
+            raise RuntimeError(glGetShaderInfoLog(shader).decode(errors="replace"))
+        glAttachShader(program, shader)
+        glDeleteShader(shader)
+
+    for name, location in ATTRIBUTES.items():
+        glBindAttribLocation(program, location, name)
+    glLinkProgram(program)
+    if not glGetProgramiv(program, GL_LINK_STATUS):
+        raise RuntimeError(glGetProgramInfoLog(program).decode(errors="replace"))
+    return program
+
+
+class Mesh:
+    def __init__(self, positions, normals, mode=GL_TRIANGLES):
+        self.count = len(positions)
+        self.mode = mode
+        vertices = np.hstack([positions, normals]).astype(np.float32)
+        self.vao = glGenVertexArrays(1)
+        glBindVertexArray(self.vao)
+
+        self.vertex_buffer = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vertex_buffer)
+        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
+        stride = vertices.itemsize * 6
+        for name, offset in (("position", 0), ("normal", 3)):
+            glEnableVertexAttribArray(ATTRIBUTES[name])
+            glVertexAttribPointer(ATTRIBUTES[name], 3, GL_FLOAT, GL_FALSE, stride,
+                                  ctypes.c_void_p(offset * vertices.itemsize))
+
+        # Per-instance data, refilled every frame
+        self.instance_buffer = glGenBuffers(1)
+        glBindBuffer(GL_ARRAY_BUFFER, self.instance_buffer)
+        stride = 4 * INSTANCE_FLOATS
+        for name, size, offset in (("offset_scale", 4, 0), ("color", 4, 4), ("yaw", 2, 8)):
+            glEnableVertexAttribArray(ATTRIBUTES[name])
+            glVertexAttribPointer(ATTRIBUTES[name], size, GL_FLOAT, GL_FALSE, stride,
+                                  ctypes.c_void_p(offset * 4))
+            glVertexAttribDivisor(ATTRIBUTES[name], 1)
+        self.instances = np.zeros((0, INSTANCE_FLOATS), dtype=np.float32)
+
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def reserve(self, n):
+        if len(self.instances) < n:
+            self.instances = np.zeros((max(n, 2 * len(self.instances)), INSTANCE_FLOATS),
+                                      dtype=np.float32)
+        return self.instances[:n]
+
+
+class InstancedRenderer:
+    # Draws every instance of a mesh with one glDrawArraysInstanced call,
+    # from per-instance NumPy data uploaded once per frame. Needs OpenGL
+    # 3.3 and GLSL 1.30, which Mesa's llvmpipe software rasterizer has.
+    MIN_VERSION = (3, 3)
+
+    def __init__(self):
+        self.program = compile_program(VERTEX_SHADER, FRAGMENT_SHADER)
+        self.uniforms = {name: glGetUniformLocation(self.program, name)
+                         for name in ("projection", "view", "lit", "light_dir")}
+        self.meshes = {}
+
+    def add_mesh(self, name, positions, normals=None, mode=GL_TRIANGLES):
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)
+        if normals is None:
+            normals = np.tile(np.float32((0, 0, 1)), (len(positions), 1))
+        self.meshes[name] = Mesh(positions, np.asarray(normals, dtype=np.float32).reshape(-1, 3),
+                                 mode)
+
+    def begin(self, projection, view, light_dir=(1, 1, 1)):
+        glUseProgram(self.program)
+        # GL expects column-major matrices, hence the transpose flag
+        glUniformMatrix4fv(self.uniforms["projection"], 1, GL_TRUE, projection)
+        glUniformMatrix4fv(self.uniforms["view"], 1, GL_TRUE, view)
+        light = np.asarray(light_dir, dtype=np.float32)
+        glUniform3f(self.uniforms["light_dir"], *(light / np.linalg.norm(light)))
+
+    def draw(self, name, positions, scales, colors, angles=None, lit=False):
+        n = len(positions)
+        if n == 0:
+            return
+        mesh = self.meshes[name]
+        instances = mesh.reserve(n)
+        instances[:, 0:3] = positions
+        instances[:, 3] = scales
+        instances[:, 4:8] = colors
+        if angles is None:
+            instances[:, 8] = 1
+            instances[:, 9] = 0
+        else:
+            radians = np.radians(angles)
+            instances[:, 8] = np.cos(radians)
+            instances[:, 9] = np.sin(radians)
+
+        glUniform1i(self.uniforms["lit"], int(lit))
+        glBindVertexArray(mesh.vao)
+        glBindBuffer(GL_ARRAY_BUFFER, mesh.instance_buffer)
+        glBufferData(GL_ARRAY_BUFFER, instances.nbytes, instances, GL_STREAM_DRAW)
+        glDrawArraysInstanced(mesh.mode, 0, mesh.count, n)
+
+    def end(self):
+        glBindVertexArray(0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glUseProgram(0)
+
+
+def create_instanced_renderer():
+    # None when the current context cannot run the shader path, in which
+    # case the caller keeps using the fixed-function renderer
+    version = gl_version()
+    if version < InstancedRenderer.MIN_VERSION:
+        print(f"instanced renderer needs OpenGL 3.3, context is {version[0]}.{version[1]}; "
+              "using fixed-function rendering", file=sys.stderr)
+        return None
+    try:
+        return InstancedRenderer()
+    except Exception as error:
+        print(f"instanced renderer unavailable ({error}); using fixed-function rendering",
+              file=sys.stderr)
+        return None
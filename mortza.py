@@ -1,11 +1,24 @@
+from startup import init_pygame, startup  # پیش از همه، تا زمان بارگذاری pygame هم شمرده شود
 import pygame
 import sys
 import math
 import random
+import time
+import argparse
 import numpy as np
 from pygame.locals import *
 from OpenGL.GL import *
 from OpenGL.GLU import *
+from spatial import SpatialHash, brute_force_pairs, overlapping_pairs
+from fonts import HudNumber, sys_font, text_cache
+from profiler import NULL_PROFILER, profiler_from_env
+from instanced import create_instanced_renderer, look_at, perspective
+from overlay import OverlayLayer
+from replay import NULL_RECORDER, Recorder, replay, state_digest, summary
+from timestep import BASE_RATE, MAX_CATCH_UP, FixedTimestep, cooldown_over
+from culling import CullStats, Frustum, cull_levels
+from governor import governor_from_budget
+from atlas import Atlas
 
 # تنظیمات اولیه
 WIDTH, HEIGHT = 1200, 800
@@ -18,6 +31,16 @@ BULLET_SPEED = 15
 ENEMY_SPAWN_RATE = 60  # فریم‌ها
 MAX_ENEMIES = 20
 WAVE_SIZE = 10
+WAVE_SPEED_BUMP = 0.2  # افزایش سرعت دشمن‌ها در هر سطح
+BULLET_SEGMENTS = 24  # تعداد قطعه‌های دایره‌ی گلوله
+USE_SPATIAL_HASH = True  # False: آزمون همه‌ی جفت‌ها، برای مقایسه و بنچمارک
+COLLISION_CELL_SIZE = 6.0
+USE_CULLING = True  # False: همه چیز بدون حذف بیرون از دید رسم می‌شود، برای مقایسه
+
+# سطح جزئیات بر اساس شعاع روی صفحه (پیکسل) در فاصله‌ی فعلی از دوربین
+BULLET_LOD_SEGMENTS = (BULLET_SEGMENTS, 12, 6)
+BULLET_LOD_PIXELS = (12, 4)
+POINT_PIXELS = 1.0  # ذرات و ستاره‌های کوچک‌تر از این به صورت نقطه رسم می‌شوند
 
 # رنگ‌ها
 PLAYER_COLOR = (0.2, 0.6, 1.0, 1.0)
@@ -34,11 +57,19 @@ TEXT_COLOR = (1.0, 1.0, 1.0, 1.0)
 BUTTON_COLOR = (0.3, 0.3, 0.6, 1.0)
 BUTTON_HOVER_COLOR = (0.4, 0.4, 0.8, 1.0)
 
+# بیت‌های ورودی هر فریم
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_UP = 4
+INPUT_DOWN = 8
+INPUT_FIRE = 16
+
 class Player:
     def __init__(self):
         self.x = 0
         self.y = -5
         self.z = -20
+        self.last_x, self.last_z = self.x, self.z
         self.size = 2
         self.speed = PLAYER_SPEED
         self.rotation = 0
@@ -50,241 +81,759 @@ class Player:
         self.last_shot = 0
         self.shoot_delay = 10
 
-    def draw(self):
+    def draw(self, alpha=1.0):
         glPushMatrix()
-        glTranslatef(self.x, self.y, self.z)
+        glTranslatef(*interpolate(self, alpha))
         glRotatef(self.rotation, 0, 1, 0)
+        glScalef(self.size, self.size, self.size)
         glColor4f(*self.color)
-        
-        # بدنه کشتی
-        glBegin(GL_TRIANGLES)
-        # نوک
-        glVertex3f(0, self.size/2, 0)
-        glVertex3f(-self.size/2, -self.size/2, 0)
-        glVertex3f(self.size/2, -self.size/2, 0)
-        
-        # بال‌ها
-        glVertex3f(-self.size, -self.size/2, 0)
-        glVertex3f(0, 0, 0)
-        glVertex3f(0, -self.size/2, 0)
-        
-        glVertex3f(self.size, -self.size/2, 0)
-        glVertex3f(0, 0, 0)
-        glVertex3f(0, -self.size/2, 0)
-        glEnd()
-        
-        # موتورها
-        glColor4f(1.0, 0.5, 0.0, 1.0)
-        glBegin(GL_QUADS)
-        glVertex3f(-self.size/3, -self.size/2, -0.5)
-        glVertex3f(-self.size/3, -self.size/2 - 0.5, -0.5)
-        glVertex3f(self.size/3, -self.size/2 - 0.5, -0.5)
-        glVertex3f(self.size/3, -self.size/2, -0.5)
-        glEnd()
-        
+        glCallList(MESHES.get("player", build_player_mesh))
         glPopMatrix()
 
-    def move(self, dx, dz):
-        self.x += dx * self.speed
-        self.z += dz * self.speed
+    def move(self, dx, dz, scale=1.0):
+        self.last_x, self.last_z = self.x, self.z
+        self.x += dx * self.speed * scale
+        self.z += dz * self.speed * scale
         
         # محدودیت حرکتی
         self.x = max(-20, min(20, self.x))
         self.z = max(-30, min(-10, self.z))
 
-    def shoot(self, bullets):
-        current_time = pygame.time.get_ticks()
-        if current_time - self.last_shot > self.shoot_delay:
+    def shoot(self, entities, current_time):
+        if cooldown_over(current_time, self.last_shot, self.shoot_delay):
             self.last_shot = current_time
-            bullets.append(Bullet(self.x, self.y, self.z, self.rotation))
+            entities.fire(self.x, self.y, self.z, self.rotation)
             return True
         return False
 
-class Bullet:
-    def __init__(self, x, y, z, rotation):
-        self.x = x
-        self.y = y
-        self.z = z
-        self.speed = BULLET_SPEED
-        self.rotation = rotation
-        self.size = 0.3
-        self.color = BULLET_COLOR
-        self.distance = 0
-
-    def update(self):
-        rad = math.radians(self.rotation)
-        self.x += math.sin(rad) * self.speed
-        self.z += math.cos(rad) * self.speed
-        self.distance += self.speed
-        
-        # برگرداندن True اگر گلوله از محدوده خارج شود
-        return (abs(self.x) > 50 or abs(self.z) > 50 or self.distance > 100)
-
-    def draw(self):
-        glPushMatrix()
-        glTranslatef(self.x, self.y, self.z)
-        glColor4f(*self.color)
+class BulletMesh:
+    # هندسه‌ی گلوله فقط یک بار ساخته می‌شود و بین همه‌ی گلوله‌ها مشترک است
+    def __init__(self, segments=BULLET_SEGMENTS):
+        self.segments = segments
+        angles = np.linspace(0, 2 * np.pi, segments, endpoint=False)
+        rim = np.zeros((segments, 3), dtype=np.float32)
+        rim[:, 0] = np.cos(angles)
+        rim[:, 1] = np.sin(angles)
         
-        # گلوله
-        glBegin(GL_TRIANGLE_FAN)
-        for i in range(360):
-            angle = math.radians(i)
-            glVertex3f(
-                math.cos(angle) * self.size,
-                math.sin(angle) * self.size,
-                0
-            )
-        glEnd()
+        # دایره‌ی واحد به صورت مثلث‌های جدا (مرکز، لبه، لبه‌ی بعدی)
+        # تا چند گلوله در یک فراخوانی GL_TRIANGLES رسم شوند
+        triangles = np.zeros((segments, 3, 3), dtype=np.float32)
+        triangles[:, 1] = rim
+        triangles[:, 2] = np.roll(rim, -1, axis=0)
+        self.triangles = triangles.reshape(-1, 3)
+        self.vertices = np.empty((0, len(self.triangles), 3), dtype=np.float32)
+
+    def draw_batch(self, positions, sizes):
+        # همه‌ی گلوله‌ها با یک فراخوانی از روی آرایه‌ی موقعیت‌ها
+        n = len(positions)
+        if n == 0:
+            return
+        if len(self.vertices) < n:
+            self.vertices = np.empty((max(n, 2 * len(self.vertices)),
+                                      len(self.triangles), 3), dtype=np.float32)
         
-        glPopMatrix()
+        vertices = self.vertices[:n]
+        np.multiply(self.triangles, np.reshape(sizes, (n, 1, 1)), out=vertices)
+        vertices += np.reshape(positions, (n, 1, 3))
+        draw_vertex_array(GL_TRIANGLES, vertices, None,
+                          count=n * len(self.triangles))
+
+BULLET_MESHES = [BulletMesh(segments) for segments in BULLET_LOD_SEGMENTS]
+
+def interpolate(entity, alpha):
+    # موقعیت بین دو گام شبیه‌سازی برای رسم نرم با گام زمانی ثابت
+    return (entity.last_x + (entity.x - entity.last_x) * alpha, entity.y,
+            entity.last_z + (entity.z - entity.last_z) * alpha)
+
+# ستون‌های مشترک همه‌ی موجودیت‌های متحرک: موقعیت، موقعیت گام قبل، بردار سرعت
+# (یک بار هنگام ساخت از زاویه حساب می‌شود) و اندازه
+MOTION_COLUMNS = {
+    "pos": ((3,), np.float64),
+    "last": ((3,), np.float64),
+    "vel": ((3,), np.float64),
+    "size": ((), np.float64),
+}
+ENEMY_COLUMNS = dict(MOTION_COLUMNS, rotation=((), np.float64), health=((), np.int64),
+                     value=((), np.int64), color=((), np.uint8))
+BULLET_COLUMNS = dict(MOTION_COLUMNS, speed=((), np.float64), distance=((), np.float64))
+ENEMY_COLOR_ARRAY = np.array(ENEMY_COLORS, dtype=np.float32)
+
+class EntityTable:
+    # هر ویژگی یک آرایه‌ی NumPy؛ موجودیت‌های زنده همیشه ردیف‌های 0 تا count
+    # هستند و ظرفیت با پر شدن دو برابر می‌شود
+    def __init__(self, columns, capacity=64):
+        self.columns = columns
+        self.capacity = capacity
+        self.count = 0
+        for name, (shape, dtype) in columns.items():
+            setattr(self, name, np.zeros((capacity,) + shape, dtype=dtype))
 
-class Enemy:
-    def __init__(self, level):
-        self.size = random.uniform(1.0, 3.0)
-        self.speed = random.uniform(1.0, 3.0) + level * 0.2
-        self.rotation = random.uniform(0, 360)
-        self.health = int(self.size * 2)
-        self.max_health = self.health
-        self.color = random.choice(ENEMY_COLORS)
-        self.value = int(self.size * 10)
+    def __len__(self):
+        return self.count
+
+    def add(self, **values):
+        if self.count == self.capacity:
+            self.capacity *= 2
+            for name in self.columns:
+                old = getattr(self, name)
+                array = np.zeros((self.capacity,) + old.shape[1:], dtype=old.dtype)
+                array[:self.count] = old[:self.count]
+                setattr(self, name, array)
+        index = self.count
+        for name, value in values.items():
+            getattr(self, name)[index] = value
+        self.count += 1
+        return index
+
+    def keep(self, alive):
+        # فشرده‌سازی با حفظ ترتیب، چون ترتیب دشمن‌ها تعیین می‌کند گلوله
+        # به کدام یک می‌خورد
+        rows = np.flatnonzero(alive)
+        if len(rows) == self.count:
+            return
+        for name in self.columns:
+            array = getattr(self, name)
+            array[:len(rows)] = array[rows]
+        self.count = len(rows)
+
+    def remove(self, indices):
+        alive = np.ones(self.count, dtype=bool)
+        alive[list(indices)] = False
+        self.keep(alive)
+
+    def clear(self):
+        self.count = 0
+
+    def move(self, scale=1.0):
+        n = self.count
+        self.last[:n] = self.pos[:n]
+        self.pos[:n] += self.vel[:n] * scale
+
+    def interpolated(self, alpha=1.0):
+        n = self.count
+        last = self.last[:n]
+        return last + (self.pos[:n] - last) * alpha
+
+    def state(self):
+        # بایت‌های همه‌ی ستون‌های زنده برای checksum
+        return b"".join(getattr(self, name)[:self.count].tobytes() for name in self.columns)
+
+class EntityWorld:
+    # دشمن‌ها و گلوله‌ها به صورت ستون‌های NumPy؛ حرکت، حذف گلوله‌های بیرون
+    # از محدوده و برخورد دشمن‌ها با بازیکن هر کدام یک عملیات برداری‌اند
+    def __init__(self):
+        self.enemies = EntityTable(ENEMY_COLUMNS)
+        self.bullets = EntityTable(BULLET_COLUMNS)
+        # قابل تغییر برای هر بازی، مثل shoot_delay بازیکن، تا sweep.py
+        # بتواند قواعد را بدون تغییر ثابت‌های ماژول عوض کند
+        self.bullet_speed = BULLET_SPEED
+        self.wave_speed = WAVE_SPEED_BUMP
+
+    def spawn_enemy(self, level, rng=random):
+        # سرعت با شماره‌ی سطح بیشتر می‌شود؛ اعداد تصادفی به همان ترتیب
+        # کلاس Enemy قبلی گرفته می‌شوند تا یک seed همان بازی را بسازد
+        size = rng.uniform(1.0, 3.0)
+        speed = rng.uniform(1.0, 3.0) + level * self.wave_speed
+        rng.uniform(0, 360)  # زاویه‌ی اولیه‌ای که همیشه جایگزین می‌شد
+        color = rng.randrange(len(ENEMY_COLORS))
         
         # موقعیت اولیه
-        angle = random.uniform(0, 2 * math.pi)
-        distance = random.uniform(20, 40)
-        self.x = math.sin(angle) * distance
-        self.y = random.uniform(-5, 5)
-        self.z = math.cos(angle) * distance
+        angle = rng.uniform(0, 2 * math.pi)
+        distance = rng.uniform(20, 40)
+        x = math.sin(angle) * distance
+        y = rng.uniform(-5, 5)
+        z = math.cos(angle) * distance
         
         # هدفگیری به سمت بازیکن
-        dx = -self.x
-        dz = -self.z
-        self.rotation = math.degrees(math.atan2(dx, dz))
+        rotation = math.degrees(math.atan2(-x, -z))
+        rad = math.radians(rotation)
+        return self.enemies.add(
+            pos=(x, y, z), last=(x, y, z),
+            vel=(math.sin(rad) * speed, 0, math.cos(rad) * speed),
+            size=size, rotation=rotation, health=int(size * 2), value=int(size * 10),
+            color=color)
+
+    def fire(self, x, y, z, rotation):
+        rad = math.radians(rotation)
+        speed = self.bullet_speed
+        return self.bullets.add(
+            pos=(x, y, z), last=(x, y, z),
+            vel=(math.sin(rad) * speed, 0, math.cos(rad) * speed),
+            size=0.3, speed=speed, distance=0)
+
+    def update_bullets(self, scale=1.0):
+        # حذف گلوله‌هایی که از محدوده خارج شده‌اند
+        bullets = self.bullets
+        bullets.move(scale)
+        n = len(bullets)
+        bullets.distance[:n] += bullets.speed[:n] * scale
+        pos = bullets.pos[:n]
+        bullets.keep((np.abs(pos[:, 0]) <= 50) & (np.abs(pos[:, 2]) <= 50)
+                     & (bullets.distance[:n] <= 100))
 
-    def update(self, player):
+    def update_enemies(self, scale=1.0):
         # حرکت به سمت بازیکن
-        rad = math.radians(self.rotation)
-        self.x += math.sin(rad) * self.speed
-        self.z += math.cos(rad) * self.speed
-        
-        # برگرداندن True اگر دشمن به بازیکن برخورد کند
-        distance = math.sqrt((self.x - player.x)**2 + (self.z - player.z)**2)
-        return distance < (self.size + player.size)
+        self.enemies.move(scale)
+
+    def contacts(self, player):
+        # برخورد با بازیکن در صفحه XZ؛ مقایسه‌ی مجذور فاصله بدون جذر
+        enemies = self.enemies
+        n = len(enemies)
+        dx = enemies.pos[:n, 0] - player.x
+        dz = enemies.pos[:n, 2] - player.z
+        reach = enemies.size[:n] + player.size
+        return np.flatnonzero(dx * dx + dz * dz < reach * reach)
+
+def bullet_arrays(bullets, alpha=1.0):
+    positions = bullets.interpolated(alpha).astype(np.float32)
+    sizes = bullets.size[:len(bullets)].astype(np.float32)
+    return positions, sizes
 
-    def draw(self):
+def draw_bullets(bullets, alpha=1.0, frustum=None, stats=None, lod=BULLET_LOD_PIXELS):
+    # گلوله‌های دورتر با دایره‌ای با قطعه‌های کمتر
+    if not bullets:
+        return
+    glColor4f(*BULLET_COLOR)
+    positions, sizes = bullet_arrays(bullets, alpha)
+    stats = stats or CullStats()
+    levels = cull_levels(frustum, positions, sizes, lod, stats)
+    for mesh, index in zip(BULLET_MESHES, levels):
+        mesh.draw_batch(positions[index], sizes[index])
+
+def draw_enemies(enemies, alpha=1.0, frustum=None, stats=None):
+    if not enemies:
+        return
+    centers = enemies.interpolated(alpha)
+    n = len(enemies)
+    visible, = cull_levels(frustum, centers, enemies.size[:n] * CUBE_RADIUS, (),
+                           stats or CullStats())
+    enemy_list = MESHES.get("enemy", build_enemy_mesh)
+    for i in visible.tolist():
+        size = float(enemies.size[i])
         glPushMatrix()
-        glTranslatef(self.x, self.y, self.z)
-        glRotatef(self.rotation, 0, 1, 0)
-        glColor4f(*self.color)
+        glTranslatef(*centers[i].tolist())
+        glRotatef(float(enemies.rotation[i]), 0, 1, 0)
+        glScalef(size, size, size)
+        glColor4f(*ENEMY_COLORS[enemies.color[i]])
+        glCallList(enemy_list)
+        glPopMatrix()
+
+class MeshCache:
+    # هر مدل فقط یک بار در یک display list ساخته می‌شود؛ هندسه‌ها با
+    # اندازه‌ی واحدند و هر نمونه با glScalef اندازه‌ی خودش را می‌گیرد
+    def __init__(self):
+        self.lists = {}
+
+    def get(self, name, build):
+        display_list = self.lists.get(name)
+        if display_list is None:
+            display_list = glGenLists(1)
+            glNewList(display_list, GL_COMPILE)
+            build()
+            glEndList()
+            self.lists[name] = display_list
+        return display_list
+
+    def clear(self):
+        for display_list in self.lists.values():
+            glDeleteLists(display_list, 1)
+        self.lists.clear()
+
+MESHES = MeshCache()
+
+# شعاع کره‌ی محیط بر مکعب واحد، برای حذف دشمن‌های بیرون از دید
+CUBE_RADIUS = math.sqrt(3)
+
+# وجه‌های مکعب واحد: نرمال و چهار گوشه به ترتیب پادساعتگرد از بیرون
+CUBE_FACES = [
+    ((0, 0, -1), [(-1, -1, -1), (-1, 1, -1), (1, 1, -1), (1, -1, -1)]),  # جلو
+    ((0, 0, 1), [(-1, -1, 1), (1, -1, 1), (1, 1, 1), (-1, 1, 1)]),  # عقب
+    ((-1, 0, 0), [(-1, -1, -1), (-1, -1, 1), (-1, 1, 1), (-1, 1, -1)]),  # چپ
+    ((1, 0, 0), [(1, -1, -1), (1, 1, -1), (1, 1, 1), (1, -1, 1)]),  # راست
+    ((0, 1, 0), [(-1, 1, -1), (-1, 1, 1), (1, 1, 1), (1, 1, -1)]),  # بالا
+    ((0, -1, 0), [(-1, -1, -1), (1, -1, -1), (1, -1, 1), (-1, -1, 1)]),  # پایین
+]
+
+def build_enemy_mesh():
+    glBegin(GL_QUADS)
+    for normal, corners in CUBE_FACES:
+        glNormal3f(*normal)
+        for corner in corners:
+            glVertex3f(*corner)
+    glEnd()
+
+# بدنه کشتی با اندازه‌ی واحد: نوک و دو بال
+PLAYER_BODY = [
+    (0, 0.5, 0), (-0.5, -0.5, 0), (0.5, -0.5, 0),
+    (-1, -0.5, 0), (0, 0, 0), (0, -0.5, 0),
+    (1, -0.5, 0), (0, 0, 0), (0, -0.5, 0),
+]
+# موتورها؛ فاصله‌های ثابت 0.5 برای اندازه‌ی پیش‌فرض 2 به واحد تبدیل شده‌اند
+PLAYER_ENGINE = [(-1/3, -0.5, -0.25), (-1/3, -0.75, -0.25),
+                 (1/3, -0.75, -0.25), (1/3, -0.5, -0.25)]
+PLAYER_ENGINE_COLOR = (1.0, 0.5, 0.0, 1.0)
+
+def build_player_mesh():
+    # بدنه کشتی
+    glNormal3f(0, 0, 1)
+    glBegin(GL_TRIANGLES)
+    for vertex in PLAYER_BODY:
+        glVertex3f(*vertex)
+    glEnd()
+    
+    # موتورها
+    glColor4f(*PLAYER_ENGINE_COLOR)
+    glBegin(GL_QUADS)
+    for vertex in PLAYER_ENGINE:
+        glVertex3f(*vertex)
+    glEnd()
+
+def quad_triangles(corners):
+    a, b, c, d = corners
+    return [a, b, c, a, c, d]
+
+def create_scene_renderer(name):
+    # رندر مبتنی بر شیدر و اینستنس؛ اگر context نسخه‌ی لازم را نداشته باشد
+    # None برمی‌گردد و مسیر قدیمی استفاده می‌شود
+    if name != "instanced":
+        return None
+    renderer = create_instanced_renderer()
+    if renderer is None:
+        return None
+    
+    cube = [(normal, corner) for normal, corners in CUBE_FACES
+            for corner in quad_triangles(corners)]
+    renderer.add_mesh("enemy", [corner for _, corner in cube], [normal for normal, _ in cube])
+    renderer.add_mesh("player", PLAYER_BODY)
+    renderer.add_mesh("player_engine", quad_triangles(PLAYER_ENGINE))
+    for level, mesh in enumerate(BULLET_MESHES):
+        renderer.add_mesh(f"bullet_{level}", mesh.triangles)
+    renderer.add_mesh("quad", quad_triangles([(-1, -1, 0), (1, -1, 0), (1, 1, 0), (-1, 1, 0)]))
+    renderer.add_mesh("point", [(0, 0, 0)], mode=GL_POINTS)
+    return renderer
+
+def draw_sprites_instanced(renderer, pos, size, color, frustum, stats):
+    # مربع برای نزدیک‌ها و نقطه برای آن‌هایی که کمتر از یک پیکسل‌اند
+    quads, points = cull_levels(frustum, pos, size, (POINT_PIXELS,), stats)
+    renderer.draw("quad", pos[quads], size[quads], color[quads])
+    renderer.draw("point", pos[points], 1, color[points])
+
+def draw_scene_instanced(renderer, world, stars, projection, view, alpha=1.0, frustum=None,
+                         stats=None, lod=BULLET_LOD_PIXELS):
+    # هر نوع موجودیت و هر سطح جزئیات با یک فراخوانی glDrawArraysInstanced
+    stats = stats or CullStats()
+    renderer.begin(projection, view)
+    shown = stars.shown
+    draw_sprites_instanced(renderer, stars.pos[:shown], stars.size[:shown], stars.color[:shown],
+                           frustum, stats)
+    
+    player = world.player
+    position = [interpolate(player, alpha)]
+    renderer.draw("player", position, player.size, [player.color], [player.rotation], lit=True)
+    renderer.draw("player_engine", position, player.size, [PLAYER_ENGINE_COLOR],
+                  [player.rotation], lit=True)
+    
+    enemies = world.enemies
+    if enemies:
+        n = len(enemies)
+        positions = enemies.interpolated(alpha)
+        sizes = enemies.size[:n]
+        visible, = cull_levels(frustum, positions, sizes * CUBE_RADIUS, (), stats)
+        renderer.draw("enemy", positions[visible], sizes[visible],
+                      ENEMY_COLOR_ARRAY[enemies.color[visible]],
+                      enemies.rotation[visible], lit=True)
+    
+    bullets = world.bullets
+    if bullets:
+        positions, sizes = bullet_arrays(bullets, alpha)
+        levels = cull_levels(frustum, positions, sizes, lod, stats)
+        for level, index in enumerate(levels):
+            renderer.draw(f"bullet_{level}", positions[index], sizes[index], BULLET_COLOR)
+    
+    particles = world.particles
+    n = particles.fade()
+    draw_sprites_instanced(renderer, particles.pos[:n], particles.size[:n], particles.color[:n],
+                           frustum, stats)
+    renderer.end()
+
+PARTICLE_CAPACITY = 65536
+PARTICLE_BURST = 20
+PARTICLE_MAX_LIFE = 40
+
+def draw_vertex_array(mode, vertices, colors, indices=None, count=None):
+    # رسم کل آرایه با یک فراخوانی؛ بدون colors رنگ فعلی استفاده می‌شود
+    if indices is not None and len(indices) == 0:
+        return
+    glEnableClientState(GL_VERTEX_ARRAY)
+    glVertexPointer(3, GL_FLOAT, 0, vertices)
+    if colors is not None:
+        glEnableClientState(GL_COLOR_ARRAY)
+        glColorPointer(4, GL_FLOAT, 0, colors)
+    if indices is None:
+        glDrawArrays(mode, 0, len(vertices) if count is None else count)
+    else:
+        glDrawElements(mode, len(indices) if count is None else count,
+                       GL_UNSIGNED_INT, indices)
+    if colors is not None:
+        glDisableClientState(GL_COLOR_ARRAY)
+    glDisableClientState(GL_VERTEX_ARRAY)
+
+def quad_indices(capacity):
+    # رئوس به صورت چهار صفحه‌ی جدا (یکی برای هر گوشه) ذخیره می‌شوند تا
+    # نوشتن آن‌ها پیوسته باشد؛ این اندیس‌ها آن‌ها را به چهارضلعی تبدیل می‌کنند
+    corners = np.arange(4, dtype=np.uint32) * capacity
+    return (np.arange(capacity, dtype=np.uint32)[:, None] + corners).ravel()
+
+def set_quad_corners(vertices, index, x, y, size):
+    # نوشتن گوشه‌های مربع‌های هم‌راستا با صفحه XY در صفحه‌های رئوس
+    left, right = x - size, x + size
+    bottom, top = y - size, y + size
+    for corner, (vx, vy) in enumerate(((left, bottom), (right, bottom),
+                                       (right, top), (left, top))):
+        vertices[corner, index, 0] = vx
+        vertices[corner, index, 1] = vy
+
+class ParticleSystem:
+    # ذرات به صورت آرایه‌های NumPy با ظرفیت ثابت نگه داشته می‌شوند؛
+    # ذرات زنده همیشه در ابتدای آرایه‌ها (از 0 تا count) قرار دارند
+    def __init__(self, capacity=PARTICLE_CAPACITY, rng=None):
+        self.capacity = capacity
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.count = 0
+        self.pos = np.zeros((capacity, 3), dtype=np.float32)
+        self.vel = np.zeros((capacity, 3), dtype=np.float32)
+        self.size = np.zeros(capacity, dtype=np.float32)
+        self.life = np.zeros(capacity, dtype=np.float32)
+        self.color = np.zeros((capacity, 4), dtype=np.float32)
+        
+        # بافرهای رسم: چهار رأس برای هر ذره
+        self.vertices = np.zeros((4, capacity, 3), dtype=np.float32)
+        self.colors = np.zeros((4, capacity, 4), dtype=np.float32)
+        self.indices = quad_indices(capacity)
+
+    def __len__(self):
+        return self.count
+
+    def emit(self, x, y, z, color, count=PARTICLE_BURST):
+        # ذرات اضافه وقتی ظرفیت پر است دور ریخته می‌شوند
+        n = min(count, self.capacity - self.count)
+        if n <= 0:
+            return 0
         
-        # بدنه دشمن
-        glBegin(GL_QUADS)
-        # جلو
-        glVertex3f(-self.size, -self.size, -self.size)
-        glVertex3f(self.size, -self.size, -self.size)
-        glVertex3f(self.size, self.size, -self.size)
-        glVertex3f(-self.size, self.size, -self.size)
-        
-        # عقب
-        glVertex3f(-self.size, -self.size, self.size)
-        glVertex3f(self.size, -self.size, self.size)
-        glVertex3f(self.size, self.size, self.size)
-        glVertex3f(-self.size, self.size, self.size)
-        
-        # چپ
-        glVertex3f(-self.size, -self.size, -self.size)
-        glVertex3f(-self.size, -self.size, self.size)
-        glVertex3f(-self.size, self.size, self.size)
-        glVertex3f(-self.size, self.size, -self.size)
-        
-        # راست
-        glVertex3f(self.size, -self.size, -self.size)
-        glVertex3f(self.size, -self.size, self.size)
-        glVertex3f(self.size, self.size, self.size)
-        glVertex3f(self.size, self.size, -self.size)
-        
-        # بالا
-        glVertex3f(-self.size, self.size, -self.size)
-        glVertex3f(self.size, self.size, -self.size)
-        glVertex3f(self.size, self.size, self.size)
-        glVertex3f(-self.size, self.size, self.size)
-        
-        # پایین
-        glVertex3f(-self.size, -self.size, -self.size)
-        glVertex3f(self.size, -self.size, -self.size)
-        glVertex3f(self.size, -self.size, self.size)
-        glVertex3f(-self.size, -self.size, self.size)
-        glEnd()
+        s = slice(self.count, self.count + n)
+        self.pos[s] = (x, y, z)
+        self.vel[s] = self.rng.uniform(-2, 2, (n, 3))
+        self.size[s] = self.rng.uniform(0.1, 0.5, n)
+        self.life[s] = self.rng.integers(20, PARTICLE_MAX_LIFE + 1, n)
+        self.color[s, :3] = color[:3]
+        self.count += n
+        return n
+
+    def update(self, scale=1.0):
+        n = self.count
+        if n == 0:
+            return
         
-        glPopMatrix()
+        if scale == 1.0:
+            self.pos[:n] += self.vel[:n]
+        else:
+            self.pos[:n] += self.vel[:n] * np.float32(scale)
+        self.life[:n] -= scale
+        size = self.size[:n]
+        np.maximum(size - 0.02 * scale, 0, out=size)
+        
+        # فشرده‌سازی: ذرات زنده انتهای آرایه جای ذرات مرده را می‌گیرند
+        dead = np.flatnonzero(self.life[:n] <= 0)
+        if len(dead) == 0:
+            return
+        alive = n - len(dead)
+        holes = dead[dead < alive]
+        movers = np.flatnonzero(self.life[alive:n] > 0) + alive
+        for array in (self.pos, self.vel, self.size, self.life, self.color):
+            array[holes] = array[movers]
+        self.count = alive
+
+    def clear(self):
+        self.count = 0
+
+    def fade(self):
+        # شفافیت با عمر باقیمانده کم می‌شود
+        n = self.count
+        np.divide(self.life[:n], PARTICLE_MAX_LIFE, out=self.color[:n, 3])
+        return n
+
+    def draw(self, frustum=None, stats=None):
+        n = self.count
+        if n == 0:
+            return
+        
+        # فقط ذرات داخل دید؛ ذرات کوچک‌تر از یک پیکسل به صورت نقطه
+        quads, points = cull_levels(frustum, self.pos[:n], self.size[:n], (POINT_PIXELS,),
+                                    stats or CullStats())
+        m = len(quads)
+        pos = self.pos[quads]
+        vertices = self.vertices
+        vertices[:, :m] = pos
+        set_quad_corners(vertices, slice(0, m), pos[:, 0], pos[:, 1], self.size[quads])
+        
+        self.fade()
+        self.colors[:, :m] = self.color[quads]
+        
+        draw_vertex_array(GL_QUADS, vertices, self.colors, self.indices, m * 4)
+        draw_vertex_array(GL_POINTS, self.pos, self.color, points.astype(np.uint32))
+
+STAR_COUNT = 200
 
-class Particle:
-    def __init__(self, x, y, z, color):
-        self.x = x
-        self.y = y
-        self.z = z
+class StarField:
+    # تمام ستاره‌ها در آرایه‌های NumPy؛ کل میدان با یک فراخوانی رسم می‌شود
+    def __init__(self, count=STAR_COUNT):
+        self.count = count
+        self.shown = count  # فقط shown ستاره‌ی اول رسم می‌شوند
+        self.pos = np.empty((count, 3), dtype=np.float32)
+        self.pos[:, 0] = np.random.uniform(-50, 50, count)
+        self.pos[:, 1] = np.random.uniform(-50, 50, count)
+        self.pos[:, 2] = np.random.uniform(-100, 100, count)
+        self.size = np.random.uniform(0.01, 0.05, count).astype(np.float32)
+        self.speed = np.random.uniform(0.1, 0.5, count).astype(np.float32)
+        
+        # رنگ ستاره‌ها ثابت است و فقط یک بار در بافر رنگ نوشته می‌شود
+        color = np.ones((count, 4), dtype=np.float32)
+        color[:, :3] = np.random.uniform(0.5, 1.0, (count, 3))
         self.color = color
-        self.size = random.uniform(0.1, 0.5)
-        self.speed_x = random.uniform(-2, 2)
-        self.speed_y = random.uniform(-2, 2)
-        self.speed_z = random.uniform(-2, 2)
-        self.life = random.randint(20, 40)
-
-    def update(self):
-        self.x += self.speed_x
-        self.y += self.speed_y
-        self.z += self.speed_z
-        self.life -= 1
-        self.size = max(0, self.size - 0.02)
-        return self.life <= 0
-
-    def draw(self):
-        glPushMatrix()
-        glTranslatef(self.x, self.y, self.z)
-        glColor4f(*self.color, self.life/40)
+        self.colors = np.empty((4, count, 4), dtype=np.float32)
+        self.colors[:] = color
         
-        glBegin(GL_QUADS)
-        glVertex3f(-self.size, -self.size, 0)
-        glVertex3f(self.size, -self.size, 0)
-        glVertex3f(self.size, self.size, 0)
-        glVertex3f(-self.size, self.size, 0)
-        glEnd()
+        self.vertices = np.empty((4, count, 3), dtype=np.float32)
+        self.vertices[:] = self.pos
+        set_quad_corners(self.vertices, slice(None),
+                         self.pos[:, 0], self.pos[:, 1], self.size)
+        self.indices = quad_indices(count)
+
+    def __len__(self):
+        return self.count
+
+    def update(self, scale=1.0):
+        z = self.pos[:, 2]
+        z += self.speed * scale
         
-        glPopMatrix()
+        # ستاره‌هایی که از جلوی دوربین رد شده‌اند به عقب برمی‌گردند
+        wrapped = np.flatnonzero(z > 100)
+        if len(wrapped):
+            z[wrapped] = -100
+            self.pos[wrapped, 0] = np.random.uniform(-50, 50, len(wrapped))
+            self.pos[wrapped, 1] = np.random.uniform(-50, 50, len(wrapped))
+            set_quad_corners(self.vertices, wrapped, self.pos[wrapped, 0],
+                             self.pos[wrapped, 1], self.size[wrapped])
 
-class Star:
-    def __init__(self):
-        self.x = random.uniform(-50, 50)
-        self.y = random.uniform(-50, 50)
-        self.z = random.uniform(-100, 100)
-        self.size = random.uniform(0.01, 0.05)
-        self.speed = random.uniform(0.1, 0.5)
-        self.color = (
-            random.uniform(0.5, 1.0),
-            random.uniform(0.5, 1.0),
-            random.uniform(0.5, 1.0),
-            1.0
-        )
-
-    def update(self):
-        self.z += self.speed
-        if self.z > 100:
-            self.z = -100
-            self.x = random.uniform(-50, 50)
-            self.y = random.uniform(-50, 50)
-
-    def draw(self):
-        glPushMatrix()
-        glTranslatef(self.x, self.y, self.z)
-        glColor4f(*self.color)
+    def draw(self, frustum=None, stats=None):
+        shown = self.shown
+        self.vertices[:, :shown, 2] = self.pos[:shown, 2]
+        if frustum is None:
+            if stats is not None:
+                stats.add(shown, shown)
+            draw_vertex_array(GL_QUADS, self.vertices, self.colors, self.indices, shown * 4)
+            return
         
-        glBegin(GL_QUADS)
-        glVertex3f(-self.size, -self.size, 0)
-        glVertex3f(self.size, -self.size, 0)
-        glVertex3f(self.size, self.size, 0)
-        glVertex3f(-self.size, self.size, 0)
-        glEnd()
+        # ستاره‌های پشت دوربین حذف و ستاره‌های دور نقطه می‌شوند
+        quads, points = cull_levels(frustum, self.pos[:shown], self.size[:shown], (POINT_PIXELS,),
+                                    stats or CullStats())
+        draw_vertex_array(GL_QUADS, self.vertices, self.colors,
+                          self.indices.reshape(-1, 4)[quads].ravel())
+        draw_vertex_array(GL_POINTS, self.pos, self.color, points.astype(np.uint32))
+
+def find_collisions(player, entities, grid=None):
+    # برگرداندن اندیس دشمن‌هایی که به بازیکن خورده‌اند و جفت‌های
+    # (گلوله، دشمن) برخوردکرده به ترتیب گلوله و سپس دشمن.
+    # با grid=None همه‌ی جفت‌ها بدون بخش‌بندی فضا آزموده می‌شوند.
+    enemies, bullets = entities.enemies, entities.bullets
+    if not enemies:
+        return [], ((), ())
+    
+    # برخورد با بازیکن یک مقایسه‌ی برداری روی همه‌ی دشمن‌هاست
+    contacts = entities.contacts(player).tolist()
+    centers = enemies.pos[:len(enemies)]
+    radii = enemies.size[:len(enemies)]
+    bullet_centers = bullets.pos[:len(bullets)]
+    bullet_radii = bullets.size[:len(bullets)]
+    
+    if grid is None:
+        hits = brute_force_pairs(bullet_centers, bullet_radii, centers, radii)
+    else:
+        grid.build(centers, radii)
+        hits = overlapping_pairs(bullet_centers, bullet_radii, centers, radii, grid)
+    
+    return contacts, (hits[0].tolist(), hits[1].tolist())
+
+def read_input(keys):
+    inputs = 0
+    if keys[K_LEFT] or keys[K_a]:
+        inputs |= INPUT_LEFT
+    if keys[K_RIGHT] or keys[K_d]:
+        inputs |= INPUT_RIGHT
+    if keys[K_UP] or keys[K_w]:
+        inputs |= INPUT_UP
+    if keys[K_DOWN] or keys[K_s]:
+        inputs |= INPUT_DOWN
+    if keys[K_SPACE]:
+        inputs |= INPUT_FIRE
+    return inputs
+
+class World:
+    # منطق بازی بدون هیچ فراخوانی pygame یا OpenGL؛ با seed یکسان و
+    # ورودی‌های یکسان همیشه همان نتیجه را می‌دهد
+    def __init__(self, seed=None):
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.player = Player()
+        self.entities = EntityWorld()
+        self.bullets = self.entities.bullets
+        self.enemies = self.entities.enemies
+        self.particles = ParticleSystem(rng=np.random.default_rng(seed))
+        self.grid = SpatialHash(COLLISION_CELL_SIZE) if USE_SPATIAL_HASH else None
+        self.spawn_rate = ENEMY_SPAWN_RATE
+        self.max_enemies = MAX_ENEMIES
+        self.particle_burst = PARTICLE_BURST
         
-        glPopMatrix()
+        self.wave = 1
+        self.enemy_spawn_timer = 0
+        self.game_over = False
+        self.level_complete = False
+        self.time = 0  # میلی‌ثانیه‌های شبیه‌سازی‌شده
+        self.level_start_time = 0
+        self.frame = 0
+        self.kills = 0
+        self.profiler = NULL_PROFILER
+
+    def step(self, inputs, dt):
+        self.frame += 1
+        self.time += dt * 1000
+        # مقادیر بازی برای فریم‌های 60 هرتز تنظیم شده‌اند
+        scale = dt * FPS
+        player = self.player
+        
+        dx, dz = 0, 0
+        if inputs & INPUT_LEFT:
+            dx = -1
+        if inputs & INPUT_RIGHT:
+            dx = 1
+        if inputs & INPUT_UP:
+            dz = -1
+        if inputs & INPUT_DOWN:
+            dz = 1
+        if inputs & INPUT_FIRE:
+            player.shoot(self.entities, self.time)
+        
+        player.move(dx, dz, scale)
+        self.profiler.mark("input")
+        
+        # به‌روزرسانی گلوله‌ها
+        self.entities.update_bullets(scale)
+        
+        # تولید دشمنان جدید
+        if not self.game_over and not self.level_complete:
+            self.enemy_spawn_timer += scale
+            if self.enemy_spawn_timer >= self.spawn_rate and len(self.enemies) < self.max_enemies:
+                self.enemy_spawn_timer = 0
+                self.entities.spawn_enemy(self.wave, self.random)
+        
+        # به‌روزرسانی دشمنان
+        self.entities.update_enemies(scale)
+        self.profiler.mark("update")
+        
+        self.collide()
+        self.profiler.mark("collision")
+        
+        # به‌روزرسانی ذرات
+        self.particles.update(scale)
+        self.profiler.mark("particles")
+        
+        # بررسی پایان سطح
+        if not self.enemies and self.enemy_spawn_timer > self.spawn_rate * 3:
+            self.level_complete = True
+            self.wave += 1
+            player.score += 1000 * self.wave
+            self.level_start_time = self.time
+        
+        # پیام پایان سطح 3 ثانیه نمایش داده می‌شود
+        if (self.level_complete and not self.game_over
+                and self.time - self.level_start_time >= 3000):
+            self.level_complete = False
+            self.enemy_spawn_timer = 0
+        
+        # به‌روزرسانی مصونیت
+        if player.invincible > 0:
+            player.invincible -= scale
+            player.color = (1.0, 0.5, 0.5, 1.0) if player.invincible % 10 < 5 else PLAYER_COLOR
+        else:
+            player.color = PLAYER_COLOR
+
+    def checksum(self):
+        # خلاصه‌ی وضعیت شبیه‌سازی برای بررسی یکسان بودن بازپخش
+        p = self.player
+        particles = self.particles
+        n = len(particles)
+        return state_digest(
+            self.frame, self.time, self.wave, self.game_over, self.level_complete,
+            self.enemy_spawn_timer,
+            (p.x, p.z, p.health, p.score, p.lives, p.invincible, p.last_shot),
+            self.enemies.state(), self.bullets.state(),
+            particles.pos[:n].tobytes(), particles.vel[:n].tobytes(), particles.life[:n].tobytes(),
+            self.random.getstate(), particles.rng.bit_generator.state)
+
+    def collide(self):
+        player = self.player
+        enemies = self.enemies
+        contacts, (hit_bullets, hit_enemies) = find_collisions(player, self.entities, self.grid)
+        removed = set()
+        
+        for index in contacts:
+            removed.add(index)
+            player.health -= 10
+            if player.health <= 0:
+                player.lives -= 1
+                player.health = 100
+                player.invincible = 120  # 2 ثانیه مصونیت
+                
+                if player.lives <= 0:
+                    self.game_over = True
+        
+        # بررسی برخورد گلوله‌ها با دشمنان؛ هر گلوله فقط به اولین دشمن می‌خورد
+        spent = set()
+        for bullet_index, enemy_index in zip(hit_bullets, hit_enemies):
+            if bullet_index in spent or enemy_index in removed:
+                continue
+            spent.add(bullet_index)
+            
+            enemies.health[enemy_index] -= 10
+            
+            # ایجاد ذرات انفجار
+            self.particles.emit(*enemies.pos[enemy_index].tolist(),
+                                ENEMY_COLORS[enemies.color[enemy_index]], self.particle_burst)
+            
+            if enemies.health[enemy_index] <= 0:
+                removed.add(enemy_index)
+                player.score += int(enemies.value[enemy_index])
+                self.kills += 1
+        
+        # حذف یک‌باره و فشرده‌سازی ستون‌ها
+        if removed:
+            enemies.remove(removed)
+        if spent:
+            self.bullets.remove(spent)
+
+def demo_input(frame):
+    # ورودی ساده‌ی خودکار برای اجرای بدون پنجره: شلیک مداوم و حرکت رفت و برگشتی
+    inputs = INPUT_FIRE
+    inputs |= INPUT_LEFT if (frame // 60) % 2 else INPUT_RIGHT
+    return inputs
+
+def run_headless(frames, seed=0):
+    world = World(seed)
+    dt = 1 / FPS
+    start = time.perf_counter()
+    for frame in range(frames):
+        world.step(demo_input(frame), dt)
+    return world, time.perf_counter() - start
 
 class Button:
     def __init__(self, x, y, width, height, text):
@@ -297,10 +846,15 @@ class Button:
         pygame.draw.rect(surface, color, self.rect, border_radius=10)
         pygame.draw.rect(surface, (255, 255, 255), self.rect, 2, border_radius=10)
         
-        text_surf = font.render(self.text, True, TEXT_COLOR)
+        text_surf = text_cache.render(font, self.text, True, TEXT_COLOR)
         text_rect = text_surf.get_rect(center=self.rect.center)
         surface.blit(text_surf, text_rect)
 
+    def add_to(self, layer, font):
+        # دکمه فقط وقتی حالت hover عوض شود دوباره کشیده می‌شود
+        layer.add(("button", self.text), self.rect, self.hovered,
+                  lambda surface: self.draw(surface, font))
+
     def check_hover(self, pos):
         self.hovered = self.rect.collidepoint(pos)
         return self.hovered
@@ -315,8 +869,11 @@ def init_gl():
     glEnable(GL_BLEND)
     glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
     
-    # نورپردازی
+    # نورپردازی؛ رنگ هر مدل از glColor به عنوان جنس سطح گرفته می‌شود
     glEnable(GL_LIGHTING)
+    glEnable(GL_COLOR_MATERIAL)
+    glColorMaterial(GL_FRONT_AND_BACK, GL_AMBIENT_AND_DIFFUSE)
+    glEnable(GL_RESCALE_NORMAL)
     glEnable(GL_LIGHT0)
     glLightfv(GL_LIGHT0, GL_POSITION, [1, 1, 1, 0])
     glLightfv(GL_LIGHT0, GL_DIFFUSE, [1.0, 1.0, 1.0, 1.0])
@@ -326,18 +883,96 @@ def init_gl():
     gluPerspective(45, (WIDTH/HEIGHT), 0.1, 100.0)
     glMatrixMode(GL_MODELVIEW)
 
-def draw_text(surface, text, position, font, color=TEXT_COLOR):
-    text_surface = font.render(text, True, color)
-    surface.blit(text_surface, position)
+def gl_matrix(name):
+    # ماتریس‌های OpenGL ستونی‌اند؛ ترانهاده برای ترتیب سطری NumPy
+    return np.asarray(glGetDoublev(name), dtype=np.float64).reshape(4, 4).T
+
+def draw_scene(world, stars, renderer=None, projection=None, alpha=1.0, stats=None,
+               lod=BULLET_LOD_PIXELS):
+    # alpha: فاصله‌ی بین دو گام آخر شبیه‌سازی برای درون‌یابی موقعیت‌ها
+    # stats: تعداد موجودیت‌های رسم‌شده و حذف‌شده‌ی این فریم
+    # lod: آستانه‌های سطح جزئیات گلوله‌ها
+    if stats is None:
+        stats = CullStats()
+    stats.reset()
+    player_x, player_y, player_z = interpolate(world.player, alpha)
+    
+    # به‌روزرسانی موقعیت دوربین بر اساس موقعیت بازیکن
+    glLoadIdentity()
+    camera_x = player_x
+    camera_y = player_y + 5
+    camera_z = player_z + 10
+    gluLookAt(camera_x, camera_y, camera_z, 
+             player_x, player_y, player_z - 10, 
+             0, 1, 0)
+    
+    # پاک کردن صفحه
+    glClearColor(*BACKGROUND_COLOR)
+    glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+    
+    if renderer is not None:
+        view = look_at((camera_x, camera_y, camera_z),
+                       (player_x, player_y, player_z - 10), (0, 1, 0))
+        frustum = Frustum(projection, view, HEIGHT) if USE_CULLING else None
+        draw_scene_instanced(renderer, world, stars, projection, view, alpha, frustum, stats, lod)
+        return
+    
+    # هرم دید از همان ماتریس‌هایی که رسم با آن‌ها انجام می‌شود
+    frustum = None
+    if USE_CULLING:
+        frustum = Frustum(gl_matrix(GL_PROJECTION_MATRIX), gl_matrix(GL_MODELVIEW_MATRIX), HEIGHT)
+    
+    # رسم ستاره‌ها؛ ستاره‌ها، گلوله‌ها و ذرات نور خودشان را دارند
+    glDisable(GL_LIGHTING)
+    stars.draw(frustum, stats)
+    
+    # رسم بازیگران
+    glEnable(GL_LIGHTING)
+    world.player.draw(alpha)
+    draw_enemies(world.enemies, alpha, frustum, stats)
+    glDisable(GL_LIGHTING)
+    draw_bullets(world.bullets, alpha, frustum, stats, lod)
+    world.particles.draw(frustum, stats)
+
+def blit_centered(surface, text_surface, y):
+    surface.blit(text_surface, (WIDTH//2 - text_surface.get_width()//2, y))
+
+def draw_status(surface, player, score_label):
+    # نوار وضعیت
+    pygame.draw.rect(surface, UI_COLOR, (10, 10, 300, 80), border_radius=10)
+    pygame.draw.rect(surface, (255, 50, 50, 200), (30, 40, player.health * 2.4, 20), border_radius=5)
+    pygame.draw.rect(surface, (200, 200, 200), (30, 40, 240, 20), 2, border_radius=5)
+    surface.blit(score_label.render(player.score), (20, 15))
+
+def draw_game_over(surface, dim, player, font, font_large):
+    # پرده‌ی نیمه‌شفاف روی لایه کشیده می‌شود تا HUD زیرش پاک نشود
+    surface.blit(dim, (0, 0))
+    blit_centered(surface, text_cache.render(font_large, "GAME OVER", True, (255, 50, 50)), HEIGHT//2 - 50)
+    blit_centered(surface, text_cache.render(font, f"امتیاز نهایی: {player.score}", True, TEXT_COLOR), HEIGHT//2 + 20)
+    blit_centered(surface, text_cache.render(font, "R - بازی مجدد   Q - خروج", True, TEXT_COLOR), HEIGHT//2 + 80)
+
+def draw_profile(surface, lines, font):
+    # هر بار عوض می‌شود پس در حافظه‌ی متن نمی‌ماند
+    for i, line in enumerate(lines):
+        surface.blit(font.render(line, True, TEXT_COLOR), (20, HEIGHT - 60 + 28 * i))
 
-def game_intro(screen, clock, font_large, font_medium):
+def create_icon():
+    icon_surface = pygame.Surface((32, 32))
+    pygame.draw.circle(icon_surface, (100, 200, 255), (16, 16), 16)
+    pygame.draw.polygon(icon_surface, (200, 200, 100), [(16, 5), (10, 27), (22, 27)])
+    return icon_surface
+
+# تصاویر رسم‌شده با pygame یک بار در اطلس روی دیسک ذخیره می‌شوند
+sprites = Atlas("mortza-sprites", {"icon": create_icon}, [__file__])
+
+def game_intro(screen, clock, font_large, font_medium, overlay):
     title_text = font_large.render("SPACE SHOOTER 3D", True, (100, 200, 255))
     subtitle_text = font_medium.render("یک بازی سه بعدی با گرافیک خفن", True, (200, 200, 100))
     
     start_button = Button(WIDTH//2 - 100, HEIGHT//2, 200, 50, "شروع بازی")
     quit_button = Button(WIDTH//2 - 100, HEIGHT//2 + 80, 200, 50, "خروج")
     
-    stars = [Star() for _ in range(200)]
+    stars = StarField()
     
     intro = True
     while intro:
@@ -354,8 +989,7 @@ def game_intro(screen, clock, font_large, font_medium):
                 return False
         
         # به‌روزرسانی ستاره‌ها
-        for star in stars:
-            star.update()
+        stars.update()
         
         # رندر سه بعدی
         glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
@@ -363,57 +997,83 @@ def game_intro(screen, clock, font_large, font_medium):
         gluLookAt(0, 0, 5, 0, 0, 0, 0, 1, 0)
         
         # رسم ستاره‌ها
-        for star in stars:
-            star.draw()
-        
-        # رندر UI
-        pygame.display.flip()
-        screen.fill((0, 0, 0, 0))
-        
-        # رسم متن
-        screen.blit(title_text, (WIDTH//2 - title_text.get_width()//2, HEIGHT//4))
-        screen.blit(subtitle_text, (WIDTH//2 - subtitle_text.get_width()//2, HEIGHT//4 + 80))
+        stars.draw()
         
         # بررسی وضعیت دکمه‌ها
         start_button.check_hover(mouse_pos)
         quit_button.check_hover(mouse_pos)
         
-        # رسم دکمه‌ها
-        start_button.draw(screen, font_medium)
-        quit_button.draw(screen, font_medium)
+        # رندر UI؛ متن‌ها ثابت‌اند و دکمه‌ها فقط با تغییر hover دوباره آپلود می‌شوند
+        overlay.begin()
+        overlay.add("title", (0, HEIGHT//4, WIDTH, 160), None,
+                    lambda surface: (blit_centered(surface, title_text, HEIGHT//4),
+                                     blit_centered(surface, subtitle_text, HEIGHT//4 + 80)))
+        start_button.add_to(overlay, font_medium)
+        quit_button.add_to(overlay, font_medium)
+        overlay.draw()
         
         pygame.display.flip()
+        startup.first_frame()
         clock.tick(FPS)
 
-def game_loop(screen, clock, font, font_large):
+# سطح‌های کیفیت جلوه‌ها از کم به زیاد:
+# (ذرات هر انفجار، کسر ستاره‌های رسم‌شده، آستانه‌های جزئیات گلوله، حداکثر دشمن)
+QUALITY_LEVELS = [
+    (5, 0.25, (48, 16), 10),
+    (10, 0.5, (24, 8), 14),
+    (15, 0.75, (16, 6), 17),
+    (PARTICLE_BURST, 1.0, BULLET_LOD_PIXELS, MAX_ENEMIES),
+]
+
+def apply_quality(level, world, stars, simulation=True):
+    # اعمال یک سطح کیفیت و برگرداندن آستانه‌های جزئیات گلوله برای رسم.
+    # ذرات انفجار و تعداد دشمن‌ها روی شبیه‌سازی اثر دارند؛ با simulation=False
+    # (مثلاً هنگام ضبط) دست نخورده می‌مانند تا بازپخش همان نتیجه را بدهد.
+    burst, star_fraction, bullet_lod, max_enemies = QUALITY_LEVELS[level]
+    stars.shown = max(1, round(stars.count * star_fraction))
+    if simulation:
+        world.particle_burst = burst
+        world.max_enemies = max_enemies
+    return bullet_lod
+
+def game_loop(screen, clock, font, font_large, overlay, profiler=NULL_PROFILER, renderer=None,
+              seed=None, recorder=NULL_RECORDER, timestep=None, max_fps=FPS, governor=None):
     # تنظیمات اولیه OpenGL
     init_gl()
+    projection = perspective(45, WIDTH/HEIGHT, 0.1, 100.0)
+    
+    world = World(seed)
+    world.profiler = profiler
+    recorder.begin_world(world)
     
-    # ایجاد بازیگران
-    player = Player()
-    bullets = []
-    enemies = []
-    particles = []
-    stars = [Star() for _ in range(200)]
+    # governor سطح کیفیت را با زمان اندازه‌گیری‌شده‌ی فریم‌ها تنظیم می‌کند
+    governor = governor or governor_from_budget(0, len(QUALITY_LEVELS))
+    simulation = not recorder.enabled
     
-    # متغیرهای بازی
-    wave = 1
-    enemy_spawn_timer = 0
-    game_over = False
-    level_complete = False
-    level_start_time = pygame.time.get_ticks()
+    # شبیه‌سازی با گام ثابت و مستقل از نرخ رسم؛ max_fps صفر یعنی بدون محدودیت
+    timestep = timestep or FixedTimestep()
+    timestep.reset()
+    stars = StarField()
+    culling = CullStats()
+    bullet_lod = apply_quality(governor.level, world, stars, simulation)
+    
+    # برچسب‌های عددی فقط وقتی مقدارشان عوض شود دوباره رندر می‌شوند
+    score_label = HudNumber(font, "امتیاز: {}", TEXT_COLOR)
+    wave_label = HudNumber(font, "سطح: {}", TEXT_COLOR)
+    lives_label = HudNumber(font, "جان: {}", TEXT_COLOR)
     
     # حلقه اصلی بازی
     running = True
     while running:
-        current_time = pygame.time.get_ticks()
+        profiler.begin_frame()
+        governor.begin_frame()
         
         # مدیریت رویدادها
         for event in pygame.event.get():
             if event.type == QUIT:
                 running = False
             
-            if game_over and event.type == KEYDOWN:
+            if world.game_over and event.type == KEYDOWN:
                 if event.key == K_r:
                     return True  # بازی مجدد
                 if event.key == K_q:
@@ -422,189 +1082,150 @@ def game_loop(screen, clock, font, font_large):
             if event.type == KEYDOWN:
                 if event.key == K_ESCAPE:
                     running = False
+        profiler.mark("events")
         
-        # دریافت وضعیت کیبورد
-        keys = pygame.key.get_pressed()
-        dx, dz = 0, 0
-        if keys[K_LEFT] or keys[K_a]:
-            dx = -1
-        if keys[K_RIGHT] or keys[K_d]:
-            dx = 1
-        if keys[K_UP] or keys[K_w]:
-            dz = -1
-        if keys[K_DOWN] or keys[K_s]:
-            dz = 1
-        if keys[K_SPACE]:
-            player.shoot(bullets)
-        
-        player.move(dx, dz)
-        
-        # به‌روزرسانی موقعیت دوربین بر اساس موقعیت بازیکن
-        glLoadIdentity()
-        camera_x = player.x
-        camera_y = player.y + 5
-        camera_z = player.z + 10
-        gluLookAt(camera_x, camera_y, camera_z, 
-                 player.x, player.y, player.z - 10, 
-                 0, 1, 0)
-        
-        # به‌روزرسانی گلوله‌ها
-        for bullet in bullets[:]:
-            if bullet.update():
-                bullets.remove(bullet)
-        
-        # تولید دشمنان جدید
-        if not game_over and not level_complete:
-            enemy_spawn_timer += 1
-            if enemy_spawn_timer >= ENEMY_SPAWN_RATE and len(enemies) < MAX_ENEMIES:
-                enemy_spawn_timer = 0
-                enemies.append(Enemy(wave))
+        # دریافت وضعیت کیبورد و پیشبرد شبیه‌سازی به تعداد گام‌های عقب‌افتاده
+        for inputs in timestep.steps(read_input(pygame.key.get_pressed())):
+            recorder.record(inputs, timestep.dt)
+            world.step(inputs, timestep.dt)
+        player = world.player
         
-        # به‌روزرسانی دشمنان
-        for enemy in enemies[:]:
-            if enemy.update(player):
-                enemies.remove(enemy)
-                player.health -= 10
-                if player.health <= 0:
-                    player.lives -= 1
-                    player.health = 100
-                    player.invincible = 120  # 2 ثانیه مصونیت
-                    
-                    if player.lives <= 0:
-                        game_over = True
-        
-        # بررسی برخورد گلوله‌ها با دشمنان
-        for bullet in bullets[:]:
-            for enemy in enemies[:]:
-                dx = bullet.x - enemy.x
-                dy = bullet.y - enemy.y
-                dz = bullet.z - enemy.z
-                distance = math.sqrt(dx*dx + dy*dy + dz*dz)
-                
-                if distance < (bullet.size + enemy.size):
-                    enemy.health -= 10
-                    
-                    # ایجاد ذرات انفجار
-                    for _ in range(20):
-                        particles.append(Particle(
-                            enemy.x, enemy.y, enemy.z,
-                            enemy.color
-                        ))
-                    
-                    if enemy.health <= 0:
-                        enemies.remove(enemy)
-                        player.score += enemy.value
-                    
-                    if bullet in bullets:
-                        bullets.remove(bullet)
-                    break
+        # ستاره‌ها فقط تزئینی‌اند و با زمان واقعی هر فریم حرکت می‌کنند
+        stars.update(timestep.frame_time * FPS)
         
-        # به‌روزرسانی ذرات
-        for particle in particles[:]:
-            if particle.update():
-                particles.remove(particle)
+        draw_scene(world, stars, renderer, projection, timestep.alpha, culling, bullet_lod)
+        profiler.mark("draw")
         
-        # به‌روزرسانی ستاره‌ها
-        for star in stars:
-            star.update()
-        
-        # بررسی پایان سطح
-        if not enemies and len(enemies) == 0 and enemy_spawn_timer > ENEMY_SPAWN_RATE * 3:
-            level_complete = True
-            wave += 1
-            player.score += 1000 * wave
-            level_start_time = current_time
-        
-        # به‌روزرسانی مصونیت
-        if player.invincible > 0:
-            player.invincible -= 1
-            player.color = (1.0, 0.5, 0.5, 1.0) if player.invincible % 10 < 5 else PLAYER_COLOR
-        else:
-            player.color = PLAYER_COLOR
-        
-        # پاک کردن صفحه
-        glClearColor(*BACKGROUND_COLOR)
-        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
-        
-        # رسم ستاره‌ها
-        for star in stars:
-            star.draw()
-        
-        # رسم بازیگران
-        player.draw()
-        for bullet in bullets:
-            bullet.draw()
-        for enemy in enemies:
-            enemy.draw()
-        for particle in particles:
-            particle.draw()
-        
-        # رندر UI
-        screen.fill((0, 0, 0, 0))
-        
-        # نوار وضعیت
-        pygame.draw.rect(screen, UI_COLOR, (10, 10, 300, 80), border_radius=10)
-        pygame.draw.rect(screen, (255, 50, 50, 200), (30, 40, player.health * 2.4, 20), border_radius=5)
-        pygame.draw.rect(screen, (200, 200, 200), (30, 40, 240, 20), 2, border_radius=5)
-        
-        draw_text(screen, f"امتیاز: {player.score}", (20, 15), font)
-        draw_text(screen, f"سطح: {wave}", (WIDTH - 120, 15), font)
-        draw_text(screen, f"جان: {player.lives}", (WIDTH - 300, 15), font)
+        # رندر UI در لایه‌ی بافت؛ فقط بخش‌هایی که تغییر کرده‌اند آپلود می‌شوند
+        overlay.begin()
+        overlay.add("status", (10, 10, 300, 80), (player.health, player.score),
+                    lambda surface: draw_status(surface, player, score_label))
+        overlay.add("lives", (WIDTH - 300, 15, 170, 40), player.lives,
+                    lambda surface: surface.blit(lives_label.render(player.lives), (WIDTH - 300, 15)))
+        overlay.add("wave", (WIDTH - 120, 15, 120, 40), world.wave,
+                    lambda surface: surface.blit(wave_label.render(world.wave), (WIDTH - 120, 15)))
         
         # نمایش وضعیت بازی
-        if game_over:
-            overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-            overlay.fill((0, 0, 0, 200))
-            screen.blit(overlay, (0, 0))
-            
-            game_over_text = font_large.render("GAME OVER", True, (255, 50, 50))
-            screen.blit(game_over_text, (WIDTH//2 - game_over_text.get_width()//2, HEIGHT//2 - 50))
-            
-            score_text = font.render(f"امتیاز نهایی: {player.score}", True, TEXT_COLOR)
-            screen.blit(score_text, (WIDTH//2 - score_text.get_width()//2, HEIGHT//2 + 20))
-            
-            restart_text = font.render("R - بازی مجدد   Q - خروج", True, TEXT_COLOR)
-            screen.blit(restart_text, (WIDTH//2 - restart_text.get_width()//2, HEIGHT//2 + 80))
+        if world.game_over:
+            overlay.add("game_over", (0, 0, WIDTH, HEIGHT), player.score,
+                        lambda surface: draw_game_over(surface, overlay.shade((0, 0, 0, 200)),
+                                                       player, font, font_large))
+        elif world.level_complete:
+            overlay.add("level_complete", (0, HEIGHT//2 - 25, WIDTH, 60), world.wave,
+                        lambda surface: blit_centered(surface, text_cache.render(
+                            font_large, f"سطح {world.wave} تکمیل شد!", True, (50, 255, 100)), HEIGHT//2 - 25))
         
-        elif level_complete:
-            if current_time - level_start_time < 3000:  # نمایش به مدت 3 ثانیه
-                level_text = font_large.render(f"سطح {wave} تکمیل شد!", True, (50, 255, 100))
-                screen.blit(level_text, (WIDTH//2 - level_text.get_width()//2, HEIGHT//2 - 25))
-            else:
-                level_complete = False
-                enemy_spawn_timer = 0
+        # نمایش زمان فریم‌ها
+        if profiler.show_overlay:
+            lines = tuple(profiler.overlay_lines())
+            overlay.add("profile", (0, HEIGHT - 60, WIDTH, 60), lines,
+                        lambda surface: draw_profile(surface, lines, font))
+        overlay.draw()
+        profiler.mark("hud")
         
         pygame.display.flip()
-        clock.tick(FPS)
+        profiler.mark("flip")
+        # زمان انتظار clock.tick جزو هزینه‌ی فریم حساب نمی‌شود
+        if governor.end_frame():
+            bullet_lod = apply_quality(governor.level, world, stars, simulation)
+        clock.tick(max_fps)
+        profiler.mark("tick")
+        profiler.end_frame(enemies=len(world.enemies), bullets=len(world.bullets),
+                           particles=len(world.particles), stars=stars.shown,
+                           overlay_pixels=overlay.uploaded, quality=governor.level,
+                           **culling.counts())
     
     return False
 
 def main():
-    # مقداردهی اولیه PyGame
-    pygame.init()
-    screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.DOUBLEBUF | pygame.OPENGL)
+    parser = argparse.ArgumentParser(description="Space Shooter 3D")
+    parser.add_argument("--headless", type=int, metavar="FRAMES",
+                        help="run FRAMES simulation steps without a window and exit")
+    parser.add_argument("--seed", type=int,
+                        help="RNG seed (headless runs default to 0, games to a random one)")
+    parser.add_argument("--renderer", choices=("fixed", "instanced"), default="fixed",
+                        help="fixed-function pipeline or instanced shaders (needs OpenGL 3.3)")
+    parser.add_argument("--record", metavar="FILE",
+                        help="write the seed and every simulation step's input to FILE")
+    parser.add_argument("--tick-rate", type=int, default=FPS,
+                        help="simulation steps per second, independent of the frame rate")
+    parser.add_argument("--max-catch-up", type=int, default=MAX_CATCH_UP,
+                        help="most simulation steps run in one frame after a stall")
+    parser.add_argument("--uncapped", action="store_true",
+                        help="render as fast as possible instead of at %d fps" % FPS)
+    parser.add_argument("--vsync", action="store_true",
+                        help="pace frames by the display's refresh instead of a timer")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="replay a recorded session without a window and verify it")
+    parser.add_argument("--startup-time", action="store_true",
+                        help="print how long the first frame took to appear, by phase")
+    parser.add_argument("--frame-budget", type=float, metavar="MS",
+                        help="lower the effects when frames take longer than MS milliseconds "
+                             "(default %.1f, or off with --vsync; 0 turns it off)" % (1000 / FPS))
+    args = parser.parse_args()
+    
+    if args.headless:
+        world, elapsed = run_headless(args.headless, args.seed or 0)
+        print(f"{args.headless} frames in {elapsed:.2f}s "
+              f"({args.headless / elapsed:.0f} frames/s), score {world.player.score}")
+        return
+    
+    # بازپخش بدون پنجره و بدون محدودیت نرخ فریم
+    if args.replay:
+        world, frames, elapsed, verified = replay(args.replay, "mortza", World)
+        print(summary(frames, elapsed, verified))
+        sys.exit(1 if verified is False else 0)
+    
+    seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+    recorder = Recorder(args.record, "mortza", seed) if args.record else NULL_RECORDER
+    
+    startup.report = args.startup_time
+    startup.mark("imports")
+    
+    # مقداردهی اولیه PyGame؛ فقط نمایش، فونت هنگام اولین استفاده
+    init_pygame("display")
+    try:
+        screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.DOUBLEBUF | pygame.OPENGL,
+                                         vsync=int(args.vsync))
+    except pygame.error:
+        # بعضی درایورها vsync را نمی‌پذیرند
+        screen = pygame.display.set_mode((WIDTH, HEIGHT), pygame.DOUBLEBUF | pygame.OPENGL)
     pygame.display.set_caption("بازی سه بعدی تیراندازی - Space Shooter 3D")
     
     # تنظیم آیکون
-    icon_surface = pygame.Surface((32, 32))
-    pygame.draw.circle(icon_surface, (100, 200, 255), (16, 16), 16)
-    pygame.draw.polygon(icon_surface, (200, 200, 100), [(16, 5), (10, 27), (22, 27)])
-    pygame.display.set_icon(icon_surface)
+    pygame.display.set_icon(sprites.subsurface("icon"))
+    startup.mark("display")
     
     clock = pygame.time.Clock()
+    max_fps = 0 if args.uncapped or args.vsync else FPS
+    timestep = FixedTimestep(args.tick_rate, args.max_catch_up)
+    profiler = profiler_from_env()
+    # با vsync انتظار برای نمایشگر در flip است و هر فریم بالای بودجه دیده می‌شود
+    budget = args.frame_budget
+    if budget is None:
+        budget = 0 if args.vsync else 1000 / FPS
+    governor = governor_from_budget(budget, len(QUALITY_LEVELS))
+    renderer = create_scene_renderer(args.renderer)
+    overlay = OverlayLayer(WIDTH, HEIGHT)
+    startup.mark("setup")
     
-    # بارگذاری فونت‌ها
-    font = pygame.font.SysFont("Arial", 24)
-    font_large = pygame.font.SysFont("Arial", 48)
-    font_medium = pygame.font.SysFont("Arial", 36)
+    # بارگذاری فونت‌ها؛ مسیر فایل فونت‌ها روی دیسک کش می‌شود
+    font = sys_font("Arial", 24)
+    font_large = sys_font("Arial", 48)
+    font_medium = sys_font("Arial", 36)
+    startup.mark("fonts")
     
     # نمایش صفحه آغازین
-    if game_intro(screen, clock, font_large, font_medium):
-        # شروع حلقه بازی
+    if game_intro(screen, clock, font_large, font_medium, overlay):
+        # شروع حلقه بازی؛ هر دور با seed بعدی تا بازپخش همان ترتیب را بسازد
         restart = True
+        games = 0
         while restart:
-            restart = game_loop(screen, clock, font, font_large)
+            restart = game_loop(screen, clock, font, font_large, overlay, profiler, renderer,
+                                seed + games, recorder, timestep, max_fps, governor)
+            games += 1
     
+    recorder.close()
     pygame.quit()
     sys.exit()
 
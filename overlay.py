@@ -0,0 +1,140 @@
+import pygame
+from OpenGL.GL import *
+
+
+class OverlayLayer:
+    # 2D UI composed on an offscreen pygame surface and shown as one
+    # textured quad over the 3D scene. Each frame the caller adds the items
+    # it wants on screen, each with a fixed rect and a state value; only
+    # the rects of items that were added, removed or changed state are
+    # repainted and re-uploaded with glTexSubImage2D.
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        self.bounds = self.surface.get_rect()
+        self.texture = None
+        self.items = {}
+        self.previous = {}
+        self.dirty = [self.bounds.copy()]
+        self.uploaded = 0
+        self.shades = {}
+
+    def begin(self):
+        self.previous, self.items = self.items, {}
+
+    def add(self, key, rect, state, paint):
+        # paint(surface) must draw inside rect; it is called again only when
+        # state (or rect) differs from the previous frame
+        self.items[key] = (pygame.Rect(rect), state, paint)
+
+    def shade(self, color):
+        # A translucent surface the size of the layer, for paint functions
+        # to blend over what is already painted; built on first use and kept
+        shade = self.shades.get(color)
+        if shade is None:
+            shade = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
+            shade.fill(color)
+            self.shades[color] = shade
+        return shade
+
+    def compose(self):
+        previous = self.previous
+        for key, (rect, state, paint) in self.items.items():
+            old = previous.get(key)
+            if old is None or old[0] != rect or old[1] != state:
+                self.dirty.append(rect)
+                if old is not None and old[0] != rect:
+                    self.dirty.append(old[0])
+        for key, (rect, state, paint) in previous.items():
+            if key not in self.items:
+                self.dirty.append(rect)
+
+        dirty = [rect.clip(self.bounds) for rect in self.dirty]
+        self.dirty = []
+        # Overlapping rects are merged so nothing is painted or sent twice.
+        # `merged` never holds two overlapping rects: a new one absorbs
+        # every rect it overlaps, checking again each time it grows.
+        merged = []
+        for rect in dirty:
+            if not rect.width or not rect.height:
+                continue
+            index = rect.collidelist(merged)
+            while index != -1:
+                rect = rect.union(merged.pop(index))
+                index = rect.collidelist(merged)
+            merged.append(rect)
+
+        surface = self.surface
+        for rect in merged:
+            surface.set_clip(rect)
+            surface.fill((0, 0, 0, 0), rect)
+            for item_rect, state, paint in self.items.values():
+                if item_rect.colliderect(rect):
+                    paint(surface)
+        surface.set_clip(None)
+        return merged
+
+    def upload(self, rects):
+        if self.texture is None:
+            self.texture = glGenTextures(1)
+            glBindTexture(GL_TEXTURE_2D, self.texture)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+            glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA, self.width, self.height, 0,
+                         GL_RGBA, GL_UNSIGNED_BYTE, None)
+            rects = [self.bounds]
+        else:
+            glBindTexture(GL_TEXTURE_2D, self.texture)
+
+        # Texture rows follow the surface, top row first
+        self.uploaded = 0
+        for rect in rects:
+            pixels = pygame.image.tobytes(self.surface.subsurface(rect), "RGBA")
+            glTexSubImage2D(GL_TEXTURE_2D, 0, rect.x, rect.y, rect.width, rect.height,
+                            GL_RGBA, GL_UNSIGNED_BYTE, pixels)
+            self.uploaded += rect.width * rect.height
+
+    def draw(self):
+        self.upload(self.compose())
+        if not self.items:
+            return
+
+        glMatrixMode(GL_PROJECTION)
+        glPushMatrix()
+        glLoadIdentity()
+        glOrtho(0, self.width, self.height, 0, -1, 1)
+        glMatrixMode(GL_MODELVIEW)
+        glPushMatrix()
+        glLoadIdentity()
+        # The blend function is set here rather than left to the caller:
+        # the intro screen draws before the game's GL state is set up
+        glPushAttrib(GL_ENABLE_BIT | GL_CURRENT_BIT | GL_COLOR_BUFFER_BIT)
+        glDisable(GL_DEPTH_TEST)
+        glDisable(GL_LIGHTING)
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+        glEnable(GL_TEXTURE_2D)
+        glColor4f(1, 1, 1, 1)
+
+        # Only the area the items cover is blended over the scene
+        rects = [rect for rect, state, paint in self.items.values()]
+        area = rects[0].unionall(rects[1:]).clip(self.bounds)
+        glBegin(GL_QUADS)
+        for x, y in (area.topleft, area.bottomleft, area.bottomright, area.topright):
+            glTexCoord2f(x / self.width, y / self.height)
+            glVertex2f(x, y)
+        glEnd()
+
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glPopAttrib()
+        glPopMatrix()
+        glMatrixMode(GL_PROJECTION)
+        glPopMatrix()
+        glMatrixMode(GL_MODELVIEW)
+
+    def release(self):
+        if self.texture is not None:
+            glDeleteTextures([self.texture])
+            self.texture = None
+            self.dirty = [self.bounds.copy()]
@@ -0,0 +1,150 @@
+import atexit
+import csv
+import json
+import os
+import time
+
+# Phases in the order a frame normally goes through them. A phase that a
+# game does not have is simply left at zero.
+PHASES = ("events", "input", "update", "collision", "particles",
+          "draw", "hud", "flip", "tick")
+
+
+class NullProfiler:
+    # Stand-in used when profiling is off, so the game loops can call the
+    # profiler unconditionally at the cost of a no-op method call.
+    enabled = False
+    show_overlay = False
+
+    def begin_frame(self):
+        pass
+
+    def mark(self, phase):
+        pass
+
+    def end_frame(self, **counts):
+        pass
+
+    def overlay_lines(self):
+        return []
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class FrameProfiler:
+    # Per-phase frame timings for the last `capacity` frames. mark(phase)
+    # charges the time since the previous mark (or begin_frame) to `phase`;
+    # end_frame() stores the frame total and any entity counts.
+    enabled = True
+
+    def __init__(self, capacity=600, phases=PHASES, clock=time.perf_counter):
+        self.capacity = capacity
+        self.phases = phases
+        self.columns = {phase: i for i, phase in enumerate(phases)}
+        self.clock = clock
+        self.times = [[0.0] * len(phases) for _ in range(capacity)]
+        self.totals = [0.0] * capacity
+        self.counts = [None] * capacity
+        self.frames = 0
+        self.current = self.times[0]
+        self.frame_start = self.last_mark = clock()
+        self.show_overlay = False
+        self.lines = []
+        self.lines_frame = -1
+
+    def __len__(self):
+        return min(self.frames, self.capacity)
+
+    def begin_frame(self):
+        self.current = self.times[self.frames % self.capacity]
+        for i in range(len(self.current)):
+            self.current[i] = 0.0
+        self.frame_start = self.last_mark = self.clock()
+
+    def mark(self, phase):
+        now = self.clock()
+        self.current[self.columns[phase]] += now - self.last_mark
+        self.last_mark = now
+
+    def end_frame(self, **counts):
+        slot = self.frames % self.capacity
+        self.totals[slot] = self.clock() - self.frame_start
+        self.counts[slot] = counts
+        self.frames += 1
+
+    def slots(self):
+        # Ring buffer slots from the oldest to the newest recorded frame
+        first = self.frames - len(self)
+        return [(first + i) % self.capacity for i in range(len(self))]
+
+    def percentiles(self, ranks=(50, 95, 99)):
+        totals = sorted(self.totals[slot] for slot in self.slots())
+        if not totals:
+            return {}
+        last = len(totals) - 1
+        return {rank: totals[round(rank / 100 * last)] for rank in ranks}
+
+    def phase_means(self):
+        slots = self.slots()
+        if not slots:
+            return {}
+        return {phase: sum(self.times[slot][column] for slot in slots) / len(slots)
+                for phase, column in self.columns.items()}
+
+    def overlay_lines(self, every=30):
+        # Recomputed every `every` frames; sorting the window each frame
+        # would cost more than the phases it is measuring.
+        if self.frames - self.lines_frame >= every:
+            self.lines_frame = self.frames
+            ranks = self.percentiles()
+            if ranks:
+                self.lines = ["frame ms  p50 %.2f  p95 %.2f  p99 %.2f"
+                              % tuple(ranks[rank] * 1000 for rank in (50, 95, 99))]
+                means = sorted(self.phase_means().items(), key=lambda item: -item[1])
+                self.lines.append("  ".join("%s %.2f" % (phase, mean * 1000)
+                                            for phase, mean in means[:4]))
+        return self.lines
+
+    def rows(self):
+        first = self.frames - len(self)
+        for i, slot in enumerate(self.slots()):
+            row = {"frame": first + i, "total_ms": self.totals[slot] * 1000}
+            for phase, column in self.columns.items():
+                row[phase + "_ms"] = self.times[slot][column] * 1000
+            row.update(self.counts[slot] or {})
+            yield row
+
+    def dump(self, path):
+        rows = list(self.rows())
+        if path.endswith(".json"):
+            summary = {"p%d_ms" % rank: value * 1000
+                       for rank, value in self.percentiles().items()}
+            with open(path, "w") as f:
+                json.dump({"phases": list(self.phases), "summary": summary,
+                           "frames": rows}, f, indent=1)
+            return
+
+        fields = []
+        for row in rows:
+            fields.extend(key for key in row if key not in fields)
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+def profiler_from_env(environ=os.environ):
+    # GAME_PROFILE=path.csv|path.json records frames and writes them there
+    # at exit; GAME_PROFILE_OVERLAY=1 shows p50/p95/p99 on screen;
+    # GAME_PROFILE_FRAMES sets how many recent frames are kept.
+    path = environ.get("GAME_PROFILE")
+    overlay = environ.get("GAME_PROFILE_OVERLAY", "0") not in ("", "0")
+    if not path and not overlay:
+        return NULL_PROFILER
+
+    profiler = FrameProfiler(int(environ.get("GAME_PROFILE_FRAMES", 600)))
+    profiler.show_overlay = overlay
+    if path:
+        atexit.register(profiler.dump, path)
+    return profiler
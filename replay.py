@@ -0,0 +1,161 @@
+import hashlib
+import struct
+import time
+
+# File layout: header, one record per simulation step, then a footer with
+# the step count and a digest of the final state of every World in the
+# session. A log without a footer (the game crashed) still replays, it
+# just cannot be verified.
+MAGIC = b"GREC"
+VERSION = 2
+HEADER = struct.Struct("<4sH8sq")    # magic, version, game name, seed
+RECORD = struct.Struct("<B")         # input bits + flags
+STEP = struct.Struct("<d")           # step length in seconds, after FRAME_DT
+FOOTER = struct.Struct("<4sI32s")    # end marker, step count, state digest
+END = b"GEND"
+
+# Set on the first step of every new World; the n-th World in a log is
+# created with seed + n
+FRAME_RESET = 0x80
+# Set when the step length differs from the previous step's, which with a
+# fixed timestep is only the first one; the exact double follows
+FRAME_DT = 0x40
+INPUT_BITS = 0x3F
+
+
+def state_digest(*parts):
+    # sha256 over a World's state. Floats go through repr, which is exact,
+    # and bytes (NumPy buffers) are hashed as they are.
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else repr(part).encode())
+    return digest.digest()
+
+
+class NullRecorder:
+    enabled = False
+
+    def begin_world(self, world):
+        pass
+
+    def record(self, inputs, dt):
+        pass
+
+    def close(self):
+        pass
+
+
+NULL_RECORDER = NullRecorder()
+
+
+class Recorder:
+    enabled = True
+
+    def __init__(self, path, game, seed):
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, game.encode(), seed))
+        self.steps = 0
+        self.world = None
+        self.states = []
+        self.reset = False
+        self.dt = None
+
+    def begin_world(self, world):
+        if self.world is not None:
+            self.states.append(self.world.checksum())
+        self.world = world
+        self.reset = True
+
+    def record(self, inputs, dt):
+        if self.reset:
+            inputs |= FRAME_RESET
+            self.reset = False
+        if dt != self.dt:
+            self.dt = dt
+            self.file.write(RECORD.pack(inputs | FRAME_DT) + STEP.pack(dt))
+        else:
+            self.file.write(RECORD.pack(inputs))
+        self.steps += 1
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.world is not None:
+            self.states.append(self.world.checksum())
+        self.file.write(FOOTER.pack(END, self.steps, state_digest(*self.states)))
+        self.file.close()
+
+
+class Log:
+    def __init__(self, game, seed, steps, digest):
+        self.game = game
+        self.seed = seed
+        self.steps = steps
+        self.digest = digest
+
+    def __len__(self):
+        return len(self.steps)
+
+
+def read_log(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, game, seed = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path}: not a version {VERSION} input log")
+
+    end = len(data)
+    digest = None
+    if end - HEADER.size >= FOOTER.size:
+        marker, count, stored = FOOTER.unpack_from(data, end - FOOTER.size)
+        if marker == END:
+            end -= FOOTER.size
+            digest = stored
+    steps = []
+    dt = None
+    offset = HEADER.size
+    while offset < end:
+        flags = data[offset]
+        offset += 1
+        if flags & FRAME_DT:
+            if offset + STEP.size > end:
+                break
+            dt, = STEP.unpack_from(data, offset)
+            offset += STEP.size
+        steps.append((flags & ~FRAME_DT, dt))
+    if digest is not None and count != len(steps):
+        raise ValueError(f"{path}: footer says {count} steps, found {len(steps)}")
+    return Log(game.rstrip(b"\0").decode(), seed, steps, digest)
+
+
+def replay(path, game, new_world):
+    # Steps the logged inputs through fresh Worlds as fast as possible.
+    # Returns the last World, the step count, the time taken and whether
+    # the final state of every World matches the recorded digest (None if
+    # the log has no footer).
+    log = read_log(path)
+    if log.game != game:
+        raise ValueError(f"{path} was recorded by {log.game!r}, not {game!r}")
+
+    world = None
+    states = []
+    start = time.perf_counter()
+    for inputs, dt in log.steps:
+        if inputs & FRAME_RESET or world is None:
+            if world is not None:
+                states.append(world.checksum())
+            world = new_world(log.seed + len(states))
+        world.step(inputs & INPUT_BITS, dt)
+    elapsed = time.perf_counter() - start
+
+    if log.digest is None:
+        return world, len(log), elapsed, None
+    if world is not None:
+        states.append(world.checksum())
+    return world, len(log), elapsed, state_digest(*states) == log.digest
+
+
+def summary(steps, elapsed, verified):
+    state = {None: "unverified", True: "matches", False: "DIFFERS"}[verified]
+    return (f"{steps} steps in {elapsed:.2f}s "
+            f"({steps / max(elapsed, 1e-9):.0f} steps/s), final state {state}")
@@ -0,0 +1,142 @@
+import itertools
+import sys
+import time
+
+import numpy as np
+
+
+class SpatialHash:
+    # Uniform-grid broad phase. Every item is stored in each cell its
+    # bounding box overlaps, so a query only has to look at the cells
+    # covered by the query box. Works for any number of dimensions.
+    def __init__(self, cell_size):
+        self.cell_size = float(cell_size)
+        self.cells = {}
+        self.lo = None
+        self.hi = None
+
+    def __len__(self):
+        return len(self.cells)
+
+    def clear(self):
+        self.cells.clear()
+        self.lo = None
+        self.hi = None
+
+    def cell_range(self, lo, hi):
+        lo = np.floor(np.asarray(lo, dtype=np.float64) / self.cell_size)
+        hi = np.floor(np.asarray(hi, dtype=np.float64) / self.cell_size)
+        return lo.astype(np.int64), hi.astype(np.int64)
+
+    def build(self, centers, radii):
+        self.clear()
+        centers = np.asarray(centers, dtype=np.float64)
+        radii = np.asarray(radii, dtype=np.float64)
+        if len(centers) == 0:
+            return
+
+        lo, hi = self.cell_range(centers - radii[:, None], centers + radii[:, None])
+        cells = self.cells
+        for index, (first, last) in enumerate(zip(map(tuple, lo.tolist()),
+                                                  map(tuple, hi.tolist()))):
+            if first == last:
+                cells.setdefault(first, []).append(index)
+                continue
+            for cell in itertools.product(*[range(a, b + 1) for a, b in zip(first, last)]):
+                cells.setdefault(cell, []).append(index)
+
+        # Occupied extent, used to clip queries
+        self.lo = lo.min(axis=0).tolist()
+        self.hi = hi.max(axis=0).tolist()
+
+    def query_cells(self, first, last):
+        # Indices of items stored in the cells from `first` to `last`
+        # (inclusive cell coordinates, as from cell_range)
+        if self.lo is None:
+            return []
+
+        ranges = []
+        for a, b, occupied_lo, occupied_hi in zip(first, last, self.lo, self.hi):
+            a = max(a, occupied_lo)
+            b = min(b, occupied_hi)
+            if a > b:
+                return []
+            ranges.append(range(a, b + 1))
+
+        cells = self.cells
+        found = [cells[cell] for cell in itertools.product(*ranges) if cell in cells]
+        if len(found) == 1:
+            return found[0]
+        return sorted(set(itertools.chain.from_iterable(found)))
+
+
+def brute_force_pairs(centers_a, radii_a, centers_b, radii_b):
+    # Reference O(A*B) test. Returns index arrays (i, j), ordered by i then
+    # j, of every pair closer than the sum of their radii.
+    centers_a = np.asarray(centers_a, dtype=np.float64)
+    centers_b = np.asarray(centers_b, dtype=np.float64)
+    if len(centers_a) == 0 or len(centers_b) == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+    delta = centers_a[:, None, :] - centers_b[None, :, :]
+    reach = np.add.outer(radii_a, radii_b)
+    return np.nonzero(np.einsum('ijk,ijk->ij', delta, delta) < reach * reach)
+
+
+def overlapping_pairs(centers_a, radii_a, centers_b, radii_b, grid):
+    # Same result as brute_force_pairs, with the candidates taken from
+    # `grid`, which must have been built from (centers_b, radii_b).
+    centers_a = np.asarray(centers_a, dtype=np.float64)
+    centers_b = np.asarray(centers_b, dtype=np.float64)
+    radii_a = np.asarray(radii_a, dtype=np.float64)
+    radii_b = np.asarray(radii_b, dtype=np.float64)
+
+    if len(centers_a) == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+    first, second = [], []
+    lo, hi = grid.cell_range(centers_a - radii_a[:, None], centers_a + radii_a[:, None])
+    for i, (cell_lo, cell_hi) in enumerate(zip(lo.tolist(), hi.tolist())):
+        candidates = grid.query_cells(cell_lo, cell_hi)
+        if candidates:
+            first.extend([i] * len(candidates))
+            second.extend(candidates)
+    if not first:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+    # Narrow phase on squared distances, for all candidates at once
+    first = np.array(first, dtype=np.intp)
+    second = np.array(second, dtype=np.intp)
+    delta = centers_a[first] - centers_b[second]
+    reach = radii_a[first] + radii_b[second]
+    hit = np.einsum('ij,ij->i', delta, delta) < reach * reach
+    return first[hit], second[hit]
+
+
+def benchmark(count_a=2000, count_b=500, extent=50.0, cell_size=6.0, seed=0):
+    rng = np.random.default_rng(seed)
+    centers_a = rng.uniform(-extent, extent, (count_a, 3))
+    centers_b = rng.uniform(-extent, extent, (count_b, 3))
+    radii_a = np.full(count_a, 0.3)
+    radii_b = rng.uniform(1.0, 3.0, count_b)
+
+    start = time.perf_counter()
+    expected = brute_force_pairs(centers_a, radii_a, centers_b, radii_b)
+    brute_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    grid = SpatialHash(cell_size)
+    grid.build(centers_b, radii_b)
+    found = overlapping_pairs(centers_a, radii_a, centers_b, radii_b, grid)
+    grid_time = time.perf_counter() - start
+
+    same = all(np.array_equal(e, f) for e, f in zip(expected, found))
+    return same, len(found[0]), brute_time, grid_time
+
+
+if __name__ == "__main__":
+    counts = [int(arg) for arg in sys.argv[1:3]] or [2000, 500]
+    same, hits, brute_time, grid_time = benchmark(*counts)
+    print(f"pairs: {hits}  match: {same}")
+    print(f"brute force: {brute_time * 1000:.2f} ms  spatial hash: {grid_time * 1000:.2f} ms")
+    sys.exit(0 if same else 1)
@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+
+# Taken before pygame is imported so its loading time is counted too; the
+# games import this module before anything else
+STARTED = time.perf_counter()
+
+import pygame
+
+
+class StartupTimer:
+    # Time from `start` to the first frame on screen, split into the phases
+    # main() marks. For the module's `startup` the first phase covers
+    # loading pygame and the rest of the game's imports.
+    def __init__(self, start=None, clock=time.perf_counter):
+        self.clock = clock
+        self.start = self.last = clock() if start is None else start
+        self.phases = []
+        self.total = None
+        self.report = False
+
+    def mark(self, phase):
+        # Charge the time since the previous mark to `phase`; nothing is
+        # recorded once the first frame is out
+        if self.total is not None:
+            return
+        now = self.clock()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    def first_frame(self):
+        # Called after every flip; only the first call counts
+        if self.total is not None:
+            return
+        self.mark("first frame")
+        self.total = self.last - self.start
+        if self.report:
+            print(self.summary(), file=sys.stderr)
+
+    def summary(self):
+        phases = ", ".join(f"{phase} {seconds * 1000:.0f}" for phase, seconds in self.phases)
+        return f"first frame after {self.total * 1000:.0f} ms ({phases})"
+
+
+startup = StartupTimer(STARTED)
+
+
+def cache_dir():
+    # Per-user directory for files the games derive at launch and keep
+    # between runs (font paths, baked sprites); GAME_CACHE_DIR overrides it
+    path = os.environ.get("GAME_CACHE_DIR")
+    if path:
+        return path
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    else:
+        base = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "pygame-games")
+
+
+def init_pygame(*modules):
+    # pygame.init() starts every submodule, audio and joysticks included,
+    # which costs time at launch for things neither game uses. Only the
+    # named ones ("display", "font", ...) are started here; fonts.sys_font
+    # starts the font module itself on first use.
+    for name in modules:
+        module = getattr(pygame, name)
+        if not module.get_init():
+            module.init()
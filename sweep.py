@@ -0,0 +1,189 @@
+import argparse
+import csv
+import itertools
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# One process per core does all the parallel work; NumPy's own thread pools
+# would only compete with it. The game module imports pygame, which must not
+# touch a display or print its banner once per worker. All of this has to
+# be set before the imports below.
+for variable in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(variable, "1")
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import numpy as np
+
+import mortza
+
+STEP = 1 / 60
+
+# Tunable rules: sweep name -> (default, object in a World that holds it)
+PARAMETERS = {
+    "spawn_rate": (mortza.ENEMY_SPAWN_RATE, lambda world: world),
+    "max_enemies": (mortza.MAX_ENEMIES, lambda world: world),
+    "bullet_speed": (mortza.BULLET_SPEED, lambda world: world.entities),
+    "shoot_delay": (mortza.Player().shoot_delay, lambda world: world.player),
+    "wave_speed": (mortza.WAVE_SPEED_BUMP, lambda world: world.entities),
+}
+
+DODGE_MARGIN = 2.0
+
+
+def autopilot(world):
+    # Fires all the time. Sidesteps the nearest enemy when it is about to
+    # touch the ship, otherwise lines up with the closest enemy in front of
+    # the guns (bullets fly towards +z).
+    inputs = mortza.INPUT_FIRE
+    enemies = world.enemies
+    n = len(enemies)
+    if n == 0:
+        return inputs
+
+    player = world.player
+    dx = enemies.pos[:n, 0] - player.x
+    dz = enemies.pos[:n, 2] - player.z
+    distance = dx * dx + dz * dz
+    nearest = int(np.argmin(distance))
+    danger = enemies.size[nearest] + player.size + DODGE_MARGIN
+    if distance[nearest] < danger * danger:
+        inputs |= mortza.INPUT_LEFT if dx[nearest] > 0 else mortza.INPUT_RIGHT
+        inputs |= mortza.INPUT_UP if dz[nearest] > 0 else mortza.INPUT_DOWN
+        return inputs
+
+    ahead = np.flatnonzero(dz > 0)
+    if len(ahead):
+        target = ahead[np.argmin(dz[ahead])]
+        if dx[target] > 1:
+            inputs |= mortza.INPUT_RIGHT
+        elif dx[target] < -1:
+            inputs |= mortza.INPUT_LEFT
+    return inputs
+
+
+def play_episode(params, seed, max_steps):
+    # One seeded game under the autopilot until game over or max_steps.
+    # Returns (survived, seconds, waves, score, kills).
+    world = mortza.World(seed)
+    for name, value in params.items():
+        setattr(PARAMETERS[name][1](world), name, value)
+    for _ in range(max_steps):
+        world.step(autopilot(world), STEP)
+        if world.game_over:
+            break
+    return (not world.game_over, world.time / 1000, world.wave, world.player.score, world.kills)
+
+
+def play_batch(index, params, seeds, max_steps):
+    # Unit of work sent to a worker process: several episodes, so the
+    # pickling round trip is small next to the simulation
+    return index, [play_episode(params, seed, max_steps) for seed in seeds]
+
+
+def aggregate(params, episodes):
+    survived, seconds, waves, scores, kills = zip(*episodes)
+    return dict(
+        params,
+        episodes=len(episodes),
+        survived=sum(survived) / len(episodes),
+        survival_s=statistics.fmean(seconds),
+        survival_s_min=min(seconds),
+        waves=statistics.fmean(waves),
+        score=statistics.fmean(scores),
+        score_std=statistics.pstdev(scores),
+        kills_per_s=statistics.fmean(k / max(s, STEP) for k, s in zip(kills, seconds)),
+    )
+
+
+def run_sweep(grid, episodes, max_steps, seed=0, workers=None, batch=8, progress=None):
+    # Every combination of the grid plays the same `episodes` seeds, so the
+    # rows differ only by the parameters. Returns one aggregated row per
+    # combination, in grid order.
+    names = list(grid)
+    combos = [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+    seeds = list(range(seed, seed + episodes))
+    results = [[] for _ in combos]
+    remaining = [episodes] * len(combos)
+
+    with ProcessPoolExecutor(workers) as pool:
+        futures = [pool.submit(play_batch, index, params, seeds[start:start + batch], max_steps)
+                   for index, params in enumerate(combos)
+                   for start in range(0, episodes, batch)]
+        for future in as_completed(futures):
+            index, rows = future.result()
+            results[index].extend(rows)
+            remaining[index] -= len(rows)
+            if remaining[index] == 0 and progress:
+                progress(aggregate(combos[index], results[index]))
+
+    return [aggregate(params, rows) for params, rows in zip(combos, results)]
+
+
+def write_rows(path, rows):
+    # Parquet when the path asks for it and pyarrow is installed, else CSV
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            path = path[:-len(".parquet")] + ".csv"
+            print(f"pyarrow is not installed; writing {path} instead", file=sys.stderr)
+        else:
+            pyarrow.parquet.write_table(pyarrow.Table.from_pylist(rows), path)
+            return path
+
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return path
+
+
+def parse_values(text, kind):
+    return [kind(value) for value in text.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Play seeded autopilot episodes of mortza.py over a grid of rules")
+    for name, (default, owner) in PARAMETERS.items():
+        kind = type(default)
+        parser.add_argument("--" + name.replace("_", "-"), default=[default], metavar="V[,V...]",
+                            type=lambda text, kind=kind: parse_values(text, kind),
+                            help=f"comma-separated values to sweep (default {default})")
+    parser.add_argument("--episodes", type=int, default=100, help="seeded episodes per combination")
+    parser.add_argument("--max-seconds", type=float, default=120,
+                        help="simulated time after which an episode counts as survived")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first episode")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--batch", type=int, default=8, help="episodes per task sent to a worker")
+    parser.add_argument("--output", default="sweep.csv", help="results, .csv or .parquet")
+    args = parser.parse_args()
+
+    grid = {name: getattr(args, name) for name in PARAMETERS}
+    max_steps = round(args.max_seconds / STEP)
+    combos = 1
+    for values in grid.values():
+        combos *= len(values)
+
+    def progress(row):
+        print("  ".join(f"{name} {row[name]}" for name in grid)
+              + f"  survived {row['survived']:.0%}  {row['survival_s']:.1f}s"
+              f"  score {row['score']:.0f}  kills/s {row['kills_per_s']:.2f}")
+
+    start = time.perf_counter()
+    rows = run_sweep(grid, args.episodes, max_steps, args.seed, args.workers, args.batch,
+                     progress)
+    elapsed = time.perf_counter() - start
+    path = write_rows(args.output, rows)
+    episodes = combos * args.episodes
+    print(f"{episodes} episodes in {elapsed:.1f}s ({episodes / elapsed:.1f}/s, "
+          f"{args.workers or os.cpu_count()} workers) -> {path}")
+
+
+if __name__ == "__main__":
+    main()
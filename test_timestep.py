@@ -0,0 +1,42 @@
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import app
+from timestep import BASE_RATE, cooldown_over
+
+
+def shot_frames(rate, seconds=2):
+    # Steps (counted from 1) on which the fighter fires with fire held down
+    world = app.World(0)
+    frames = []
+    last = world.fighter.last_shot
+    for frame in range(1, rate * seconds + 1):
+        world.step(app.INPUT_FIRE, 1 / rate)
+        if world.fighter.last_shot != last:
+            frames.append(frame)
+            last = world.fighter.last_shot
+    return frames
+
+
+def test_fighter_fires_on_the_original_60hz_frames():
+    assert shot_frames(BASE_RATE) == [13, 25, 38, 51, 64, 76, 88, 100, 112]
+
+
+def test_fire_rate_does_not_follow_the_tick_rate():
+    for rate in (144, 240):
+        frames = shot_frames(rate)
+        assert len(frames) == 9
+        # Every shot within two 60 Hz frames of the 60 Hz one: the 60 Hz
+        # cadence itself alternates between 12 and 13 frames
+        for shot, base in zip(frames, shot_frames(BASE_RATE)):
+            assert abs(shot / rate - base / BASE_RATE) <= 2 / BASE_RATE
+
+
+def test_cooldown_waits_for_the_60hz_frame():
+    frame = 1000 / BASE_RATE
+    assert not cooldown_over(10, 0, 10)
+    assert cooldown_over(frame, 0, 10)
+    # 240 Hz ticks between 60 Hz frames wait for the next frame
+    assert not cooldown_over(frame + 12.5, frame, 10)
+    assert cooldown_over(2 * frame, frame, 10)
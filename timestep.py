@@ -0,0 +1,75 @@
+import math
+import time
+
+# Gameplay constants in both games are tuned per 60 Hz frame; a World
+# stepped with dt scales them by dt * BASE_RATE.
+BASE_RATE = 60
+MAX_CATCH_UP = 5
+# Simulated times are sums of float tick lengths, so a tick can land a
+# hair short of the moment it stands for
+TIME_EPSILON = 1e-6
+
+
+def cooldown_over(now, last, delay, frame=1000 / BASE_RATE):
+    # For actions repeated every `delay` ms (shooting): true once more than
+    # `delay` has passed since `last`, and, at tick rates finer than 60 Hz,
+    # the 60 Hz frame a 60 Hz game would act on has been reached. Repeated
+    # actions keep the cadence they have at 60 Hz whatever the tick rate.
+    if now - last <= delay:
+        return False
+    due = math.ceil((last + delay) / frame - TIME_EPSILON) * frame
+    return now >= due - TIME_EPSILON
+
+class FixedTimestep:
+    # Accumulates real time and hands it to the simulation in fixed ticks
+    # of 1 / rate seconds, however fast or slow frames are rendered. At
+    # most `max_ticks` run per frame; time beyond that is dropped so a slow
+    # machine falls behind real time instead of spiralling. `alpha` is how
+    # far the next tick is, for interpolating between the last two states.
+    def __init__(self, rate=BASE_RATE, max_ticks=MAX_CATCH_UP, clock=time.perf_counter):
+        self.rate = rate
+        self.dt = 1 / rate
+        self.max_ticks = max_ticks
+        self.clock = clock
+        self.last = clock()
+        self.frame_time = 0.0
+        self.accumulator = 0.0
+        self.pending = 0
+        self.ticks = 0
+        self.dropped = 0
+
+    @property
+    def alpha(self):
+        return self.accumulator / self.dt
+
+    def reset(self):
+        self.last = self.clock()
+        self.accumulator = 0.0
+        self.pending = 0
+
+    def advance(self):
+        # Number of ticks due this frame
+        now = self.clock()
+        self.frame_time = now - self.last
+        self.last = now
+        self.accumulator += self.frame_time
+        ticks = int(self.accumulator / self.dt)
+        if ticks > self.max_ticks:
+            self.dropped += ticks - self.max_ticks
+            ticks = self.max_ticks
+            self.accumulator = self.dt * ticks + self.accumulator % self.dt
+        self.accumulator -= ticks * self.dt
+        self.ticks += ticks
+        return ticks
+
+    def steps(self, inputs):
+        # Input bits for every tick due this frame. Bits read on frames that
+        # run no tick are kept for the next one, so a key press is never
+        # lost when rendering outpaces the simulation.
+        inputs |= self.pending
+        ticks = self.advance()
+        if ticks == 0:
+            self.pending = inputs
+            return []
+        self.pending = 0
+        return [inputs] * ticks